@@ -1,87 +1,59 @@
+import os
 import pandas as pd
-import yfinance as yf
-from datetime import datetime
-import math
-from scipy.stats import mstats
-import matplotlib.pyplot as plt
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from reportlab.platypus import Table, TableStyle
-from reportlab.lib import colors
 import numpy as np
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-
-def get_returns(ticker, year):
-    start_date = f"{year-1}-12-01"
-    end_date = f"{year}-12-31"
-    data = yf.download(ticker, start=start_date, end=end_date, interval='1mo')
+from instrumentation import Profiler, instrumented, set_profiler
+from metrics import PERIODS_PER_YEAR, StreamingMetrics, compute_metrics
+from price_cache import DEFAULT_CACHE_PATH, PriceCache, get_price_cache, set_price_cache
+from rankings_store import get_rankings_store, selection_method
+from result_store import DEFAULT_RESULT_STORE_PATH, UNFINISHED_FINGERPRINT, ResultStore, config_key, fingerprint
+from returns_panel import ReturnsPanel, year_window
+from significance import DEFAULT_SIMULATIONS, significance_tests, year_universe
+from strategies import DEFAULT_STRATEGIES, STRATEGIES
+from ticker_index import DEFAULT_MAPPING_PATH, TickerIndex, inexact_matches, unmapped_brands
+
+# Report rendering lives in report, which pulls in matplotlib and reportlab. Its functions are
+# re-exported here for existing callers but only imported on first use, so runs that never render
+# a report do not pay for those imports.
+REPORT_FUNCTIONS = {'create_pdf', 'plot_cumulative_returns', 'plot_yearly_returns', 'render_report'}
+# The market every strategy is compared with, the S&P 500
+MARKET_TICKER = '^GSPC'
+
+def __getattr__(name):
+    if name in REPORT_FUNCTIONS:
+        import report
+        return getattr(report, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@instrumented()
+def get_returns(ticker, year, price_cache=None):
+    start_date, end_date = year_window(year)
+    if price_cache is None:
+        price_cache = get_price_cache()
+    adj_close = price_cache.get_prices(ticker, start_date, end_date, interval='1mo')
     
-    if len(data) < 12:
+    if len(adj_close) < 12:
         return [], 0
     
-    # Calculate the monthly returns by comparing the open price of the month to the close price of the same month
-    monthly_returns = []
-    for i in range(1, len(data)):
-        prev_close_price = data['Adj Close'].iloc[i-1]
-        current_close_price = data['Adj Close'].iloc[i]
-        monthly_return = (current_close_price / prev_close_price) - 1
-        monthly_returns.append(monthly_return)
-
-    yearly_return = data['Adj Close'].iloc[-1] / data['Adj Close'].iloc[0] - 1
+    # Calculate the monthly returns by comparing the close price of each month to the close price of the previous month
+    monthly_returns = adj_close.pct_change(fill_method=None).iloc[1:].tolist()
+
+    yearly_return = adj_close.iloc[-1] / adj_close.iloc[0] - 1
     return monthly_returns, yearly_return
 
-def create_pdf(pdf_path, table_data, stock_details_top_brands, stock_details_most_improved_exact, stock_details_most_improved_weighted):
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-    story = []
-    styles = getSampleStyleSheet()
-
-    # Add cumulative and yearly returns images
-    story.append(Paragraph('<b>Cumulative Returns</b>', styles['Heading2']))
-    story.append(Image('data/cumulative_returns.png', 6*inch, 3*inch))  # Adjust dimensions as needed
-    story.append(Spacer(1, 12))
-
-    story.append(Paragraph('<b>Yearly Returns</b>', styles['Heading2']))
-    story.append(Image('data/yearly_returns.png', 6*inch, 3*inch))  # Adjust dimensions as needed
-    story.append(Spacer(1, 12))
-
-    # Add net returns and Sharpe Ratios table
-    story.append(Paragraph('<b>Net Returns and Sharpe Ratios</b>', styles['Heading2']))
-    table = Table(table_data, colWidths=[2.5*inch]*len(table_data[0]))
-    story.append(table)
-    story.append(Spacer(1, 12))
-
-    # Function to add stock details to the story
-    def add_stock_details_to_story(strategy_name, stock_details):
-        story.append(Paragraph(f'<b>{strategy_name} Strategy</b>', styles['Heading2']))
-        for year, stocks in stock_details.items():
-            story.append(Paragraph(f'Year {year}', styles['Heading3']))
-            for ticker, return_val in stocks:
-                story.append(Paragraph(f'{ticker}: {return_val:.2%}', styles['Normal']))
-            story.append(Spacer(1, 12))
-
-    # Add stock details for each strategy
-    add_stock_details_to_story('Top Brands', stock_details_top_brands)
-    add_stock_details_to_story('Most Improved Brands (Exact)', stock_details_most_improved_exact)
-    add_stock_details_to_story('Most Improved Brands (Weighted)', stock_details_most_improved_weighted)
-
-    doc.build(story)
-
-def calculate_performance_metrics(monthly_returns):
-    # Assuming monthly_returns is a list of monthly returns
-    monthly_returns_series = pd.Series(monthly_returns)
-    # Calculate Sharpe Ratio using a risk-free rate, assuming it to be 0 for simplicity
-    excess_returns = monthly_returns_series  # Assuming no risk-free rate
-    print(f'Excess returns: {excess_returns}, mean: {excess_returns.mean()}, std: {excess_returns.std()}')
-    sharpe_ratio = excess_returns.mean() / excess_returns.std() * (12 ** 0.5)  # Annualize Sharpe Ratio
-    # Add more metrics like Sortino, Treynor, Max Drawdown, VaR, etc.
-    # ...
-    return {
-        'sharpe_ratio': sharpe_ratio,
-        # ... other metrics
-    }
+@instrumented()
+def calculate_performance_metrics(monthly_returns, periods_per_year=12, benchmark_returns=None):
+    # monthly_returns is a list of returns per period: monthly by default, daily with periods_per_year=252
+    returns = np.asarray(monthly_returns, dtype=float)
+    benchmark = None
+    # Beta needs the benchmark returns of the same periods
+    if benchmark_returns is not None and len(benchmark_returns) == len(returns):
+        benchmark = np.asarray(benchmark_returns, dtype=float)
+    # Sharpe, Sortino, drawdowns, VaR/CVaR and beta, assuming no risk-free rate
+    metrics = {name: float(values[0]) for name, values in compute_metrics(returns, periods_per_year, benchmark).items()}
+    print(f"Returns: {len(returns)} periods, mean: {metrics['mean_return']}, Sharpe: {metrics['sharpe_ratio']}, "
+          f"Sortino: {metrics['sortino_ratio']}, Max drawdown: {metrics['max_drawdown']}, Historical VaR: {metrics['historical_var']}, "
+          f"Beta: {metrics.get('beta', 'N/A')}")
+    return metrics
 
 def calculate_net_returns(yearly_returns):
     """
@@ -98,60 +70,151 @@ def calculate_net_returns(yearly_returns):
     net_return = cumulative_return - 1
     return net_return
 
-def load_ticker_mapping(mapping_file_path):
-    return pd.read_excel(mapping_file_path).set_index('Brand')['Ticker'].to_dict()
-
+@instrumented()
+def stack_returns(results, start_year, end_year, path=None):
+    """
+    Stack the period returns of every series in results into one (periods x series) array, in
+    the order of results, with NaN where a series has no return. Rows are the dates of all
+    series, so returns of the same date line up even when the series trade on different days.
+    With path the array is a memory-mapped .npy file. Returns the array and the year of each row.
+    """
+    years = range(start_year, end_year + 1)
+    columns = [pd.concat([period_returns[year] for year in years if len(period_returns.get(year, []))] or [pd.Series(dtype=float)])
+               for period_returns, _, _ in results.values()]
+    dates = pd.DatetimeIndex(sorted(set().union(*(column.index for column in columns))))
+    shape = (len(dates), len(results))
+    returns = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=shape) if path else np.empty(shape)
+    for i, column in enumerate(columns):
+        returns[:, i] = column.reindex(dates).to_numpy(dtype=float)
+    return returns, dates.year.to_numpy()
+
+def yearly_sharpe_ratios(returns, row_years, periods_per_year=12):
+    # One pass over each year's rows for all series at once, keyed by year
+    sharpe_ratios = {}
+    for year in np.unique(row_years):
+        accumulator = StreamingMetrics(returns.shape[1], periods_per_year)
+        accumulator.update(np.asarray(returns[row_years == year], dtype=float))
+        sharpe_ratios[int(year)] = accumulator.result()['sharpe_ratio']
+    return sharpe_ratios
+
+def rolling_metrics_frame(metrics, row_years, labels):
+    """
+    Long table of the rolling metrics returned by compute_metrics: one row per year, period within
+    the year and series label, leaving out periods before the first full window.
+    """
+    names = [name for name in metrics if name.startswith('rolling_')]
+    periods = pd.Series(row_years).groupby(row_years).cumcount().to_numpy() + 1
+    # Row-major ravel of a (periods x series) array repeats each period once per series
+    frame = pd.DataFrame({'year': np.repeat(row_years, len(labels)), 'period': np.repeat(periods, len(labels)),
+                          'strategy': np.tile(labels, len(row_years))})
+    for name in names:
+        frame[name] = np.asarray(metrics[name]).ravel()
+    return frame.dropna(subset=names, how='all').reset_index(drop=True)
+
+@instrumented()
+def load_ticker_mapping(mapping_file_path, normalized=False):
+    # A compiled TickerIndex, read from its binary cache unless the spreadsheet changed.
+    # Brands match on exact names and aliases unless normalized, see TickerIndex
+    return TickerIndex.load(mapping_file_path, normalized=normalized)
+
+@instrumented()
 def load_brand_rankings(year, rankings_directory, most_improved=False, weighted=False, number_of_brands=10):
-    rankings_file_path = f"{rankings_directory}/brandirectory-ranking-data-global-{year}.csv"
-    rankings = pd.read_csv(rankings_file_path)
-
-    # Convert 'Previous Position' to numeric, coercing non-numeric values to NaN
-    rankings['Previous Position'] = pd.to_numeric(rankings['Previous Position'], errors='coerce')
-    # Fill NaN values with a large number to minimize their effect
-    rankings['Previous Position'] = rankings['Previous Position'].fillna(501)
-    # Calculate the position change
-    rankings['Position Change'] = rankings['Previous Position'] - rankings['Position']
-
-    if most_improved:
-        if weighted:
-            # Apply weighting: the smaller the previous position, the larger the weight for the same position change
-            rankings['Weighted Change'] = rankings['Position Change'] / rankings['Previous Position']
-            # Sort by weighted change, higher is better
-            top_movers = rankings.sort_values(by='Weighted Change', ascending=False).head(number_of_brands)['Brand']
-        else:
-            # Sort by exact position change, higher is better
-            top_movers = rankings.sort_values(by='Position Change', ascending=False).head(number_of_brands)['Brand']
-        return top_movers
-    else:
-        top_brands = rankings.head(number_of_brands)['Brand']
-        return top_brands
-
-def calculate_returns_for_brands(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved=False, weighted=False):
-    monthly_returns = {}
-    yearly_returns = {}
-    stock_details = {}
-
+    # Rankings of all years are parsed once and the brand order of each selection method is precomputed
+    store = get_rankings_store(rankings_directory)
+    brands = store.select(year, selection_method(most_improved, weighted), number_of_brands)
+    return pd.Series(brands, name='Brand')
+
+def get_tickers_for_brands(ticker_mapping, brands, year=None):
+    # Brands are matched on exact names and aliases (or normalized names, if the index is); with a year, only tickers valid in that year match
+    return ticker_mapping.tickers(brands, year)
+
+@instrumented()
+def select_tickers_by_year(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved=False, weighted=False):
+    ticker_mapping.join_rankings(get_rankings_store(rankings_directory).table)
+    tickers_by_year = {}
     for year in range(start_year, end_year + 1):
         brands = load_brand_rankings(year, rankings_directory, most_improved, weighted, number_of_brands)
-        tickers = [ticker_mapping.get(brand) for brand in brands if (ticker_mapping.get(brand, 'N/A') != 'N/A' and not (type(ticker_mapping.get(brand))==float and math.isnan(ticker_mapping.get(brand))))]
-        print(f"Tickers for {year}: {tickers}")
-        if not tickers:
-            continue
-        all_returns, yearly_returns_list= zip(*[get_returns(ticker, year) for ticker in tickers if ticker is not None])
-        avg_yearly_return = sum(yearly_returns_list) / len(yearly_returns_list)
-        average_monthly_returns = [sum(month) / len(month) for month in zip(*all_returns)]
-        monthly_returns[year] = average_monthly_returns
-        yearly_returns[year] = avg_yearly_return
-
-        year_stock_details = []
-        for ticker in tickers:
-            if ticker is not None:
-                m_returns, y_return = get_returns(ticker, year)
-                year_stock_details.append((ticker, y_return))
-        
-        stock_details[year] = year_stock_details
-
-    return monthly_returns, yearly_returns, stock_details
+        tickers_by_year[year] = get_tickers_for_brands(ticker_mapping, brands, year)
+        print(f"Tickers for {year}: {tickers_by_year[year]}")
+    return tickers_by_year
+
+def get_ticker_weights(ticker_mapping, brand_weights, year=None):
+    # Brands mapped to the same ticker add up their weights; unmapped brands are dropped
+    ticker_weights = {}
+    for ticker, weight in zip(ticker_mapping.resolve(brand_weights.index, year), brand_weights):
+        if ticker is not None:
+            ticker_weights[ticker] = ticker_weights.get(ticker, 0.0) + float(weight)
+    return ticker_weights
+
+@instrumented()
+def select_strategy_tickers(strategy, ticker_mapping, start_year, end_year, rankings_directory, number_of_brands):
+    # Equal-weighted strategies give a list of tickers per year, weighted ones a {ticker: weight} dict
+    ticker_mapping.join_rankings(get_rankings_store(rankings_directory).table)
+    tickers_by_year = {}
+    for year in range(start_year, end_year + 1):
+        brands = strategy.select(rankings_directory, year, number_of_brands)
+        if isinstance(brands, pd.Series):
+            tickers_by_year[year] = get_ticker_weights(ticker_mapping, brands, year)
+        else:
+            tickers_by_year[year] = get_tickers_for_brands(ticker_mapping, brands, year)
+        print(f"Tickers for {year} ({strategy.name}): {list(tickers_by_year[year])}")
+    return tickers_by_year
+
+@instrumented()
+def calculate_returns_for_brands(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved=False, weighted=False, panel=None):
+    tickers_by_year = select_tickers_by_year(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved, weighted)
+    if panel is None:
+        tickers = [ticker for tickers in tickers_by_year.values() for ticker in tickers]
+        panel = ReturnsPanel.from_cache(get_price_cache(), tickers, start_year, end_year)
+    return panel.portfolio_returns({'strategy': tickers_by_year}, start_year, end_year)['strategy']
+
+@instrumented()
+def calculate_returns_incremental(selections, configs, start_year, end_year, price_cache, result_store, ranking_hashes, interval='1mo'):
+    """
+    Same results as ReturnsPanel.portfolio_returns, but years whose rankings, tickers and prices are
+    unchanged since they were stored in result_store are reused, and only the other years are computed.
+    """
+    results = {name: ({}, {}, {}) for name in selections}
+
+    def year_fingerprint(name, year):
+        tickers = selections[name].get(year, [])
+        # The window is part of the fingerprint, so results stored before it changed are computed again
+        window = year_window(year, interval)
+        return fingerprint(ranking_hashes.get(year), tickers, window, price_cache.version(tickers, *window, interval))
+
+    def add_result(name, year, monthly, yearly, details):
+        if yearly is not None:
+            results[name][0][year] = monthly
+            results[name][1][year] = yearly
+            results[name][2][year] = details
+
+    missing = {}
+    for name in selections:
+        for year in range(start_year, end_year + 1):
+            stored = result_store.get(configs[name], year, year_fingerprint(name, year))
+            if stored is None:
+                missing.setdefault(name, {})[year] = selections[name].get(year, [])
+            else:
+                add_result(name, year, *stored)
+    if not missing:
+        return results
+
+    years = [year for by_year in missing.values() for year in by_year]
+    print(f"Computing {sum(len(by_year) for by_year in missing.values())} new strategy years for {sorted(set(years))}")
+    tickers = [ticker for by_year in missing.values() for year_tickers in by_year.values() for ticker in year_tickers]
+    panel = ReturnsPanel.from_cache(price_cache, tickers, min(years), max(years), interval)
+    computed = panel.portfolio_returns(missing, min(years), max(years))
+    for name, by_year in missing.items():
+        monthly_returns, yearly_returns, stock_details = computed[name]
+        for year, year_tickers in by_year.items():
+            monthly, yearly, details = monthly_returns.get(year, pd.Series(dtype=float)), yearly_returns.get(year), stock_details.get(year, [])
+            # Years without data are stored too, so they are not recomputed on the next run. Years with tickers whose prices were
+            # never fetched (offline) are stored as unfinished: the next run computes them again, and rolled_metrics uses this result
+            window = year_window(year, interval)
+            unfinished = any(price_cache.missing_ranges(ticker, *window, interval) for ticker in year_tickers)
+            result_store.put(configs[name], year, UNFINISHED_FINGERPRINT if unfinished else year_fingerprint(name, year), monthly, yearly, details)
+            add_result(name, year, monthly, yearly, details)
+    return results
 
 def get_market_monthly_returns(index_ticker, start_year, end_year):
     market_returns = {}
@@ -160,151 +223,196 @@ def get_market_monthly_returns(index_ticker, start_year, end_year):
         market_returns[year], market_yearly_returns[year] = get_returns(index_ticker, year)
     return market_returns, market_yearly_returns
 
-def plot_cumulative_returns(total_yearly_returns_top_brands, total_yearly_returns_most_improved_exact, total_yearly_returns_most_improved_weighted, total_yearly_returns_market, start_year, end_year):
-    plt.clf()
-    # Plot the cumulative returns over time from yearly returns.
-    cumulative_returns_top_brands, cumulative_returns_most_improved_exact, cumulative_returns_most_improved_weighted, cumulative_returns_market = [1], [1], [1], [1]
-    for i in range(len(total_yearly_returns_market)):
-        cumulative_returns_top_brands.append(cumulative_returns_top_brands[-1] * (1 + total_yearly_returns_top_brands[i]))
-        cumulative_returns_most_improved_exact.append(cumulative_returns_most_improved_exact[-1] * (1 + total_yearly_returns_most_improved_exact[i]))
-        cumulative_returns_most_improved_weighted.append(cumulative_returns_most_improved_weighted[-1] * (1 + total_yearly_returns_most_improved_weighted[i]))
-        cumulative_returns_market.append(cumulative_returns_market[-1] * (1 + total_yearly_returns_market[i]))
-
-    # Plot the cumulative returns
-    print(f'Cumulative Returns: {cumulative_returns_top_brands}')
-    plt.plot(cumulative_returns_top_brands, label='Top Brands')
-    plt.plot(cumulative_returns_most_improved_exact, label='Most Improved Brands (Exact)')
-    plt.plot(cumulative_returns_most_improved_weighted, label='Most Improved Brands (Weighted)')
-    plt.plot(cumulative_returns_market, label='S&P 500 Market')
-
-    # Add labels and legend
-    plt.xlabel('Year')
-    plt.ylabel('Cumulative Returns')
-
-    # Add xticks starting from start_year-1(2020) to end_year+1(2022)
-    plt.xticks(range(len(total_yearly_returns_market)+1), range(start_year-1, end_year+1))
-    
-    plt.legend()
-    plt.savefig('data/cumulative_returns.png', format='png')
-
-def plot_yearly_returns(total_yearly_returns_top_brands, total_yearly_returns_most_improved_exact, total_yearly_returns_most_improved_weighted, total_yearly_returns_market, start_year, end_year):
-    # Reset the plot
-    plt.clf()
-
-    # Number of groups (years)
-    num_groups = len(total_yearly_returns_market)
-
-    # Positions for the bars on the x-axis
-    bar_width = 0.2
-    index = np.arange(num_groups)
-
-    # Plot each strategy
-    plt.bar(index, total_yearly_returns_top_brands, bar_width, label='Top Brands')
-    plt.bar(index + bar_width, total_yearly_returns_most_improved_exact, bar_width, label='Most Improved Brands (Exact)')
-    plt.bar(index + 2 * bar_width, total_yearly_returns_most_improved_weighted, bar_width, label='Most Improved Brands (Weighted)')
-    plt.bar(index + 3 * bar_width, total_yearly_returns_market, bar_width, label='S&P 500 Market')
-
-    # Add labels and legend
-    plt.xlabel('Year')
-    plt.ylabel('Yearly Returns')
-    plt.title('Yearly Returns by Strategy')
-    plt.xticks(index + bar_width, range(start_year, end_year + 1))
-    plt.legend()
-
-    # Save the figure
-    plt.savefig('data/yearly_returns.png', format='png')
-
-def table_net_returns_and_sharpe_ratios(annualized_return_top_brands, annualized_return_most_improved_exact, annualized_return_most_improved_weighted, annualized_return_market, net_sharpe_ratio_top_brands, net_sharpe_ratio_most_improved_exact, net_sharpe_ratio_most_improved_weighted, net_sharpe_ratio_market):
-    # Create a table with the net returns and Sharpe Ratios
-    table_data = [
-        ['Top Brands', annualized_return_top_brands, net_sharpe_ratio_top_brands],
-        ['Most Improved Brands (Exact)', annualized_return_most_improved_exact, net_sharpe_ratio_most_improved_exact],
-        ['Most Improved Brands (Weighted)', annualized_return_most_improved_weighted, net_sharpe_ratio_most_improved_weighted],
-        ['S&P 500 Market', annualized_return_market, net_sharpe_ratio_market]
-    ]
-    table = pd.DataFrame(table_data, columns=['', 'Annualized Return', 'Net Sharpe Ratio'])
+def table_net_returns_and_sharpe_ratios(net_metrics_by_strategy, p_values_by_strategy=None):
+    # Create a table with the net returns and Sharpe Ratios; net_metrics_by_strategy maps each label to (annualized return, Sharpe ratio)
+    table_data = [[label, annualized_return, net_sharpe_ratio] for label, (annualized_return, net_sharpe_ratio) in net_metrics_by_strategy.items()]
+    columns = ['', 'Annualized Return', 'Net Sharpe Ratio']
+    if p_values_by_strategy is not None:
+        # p-values of the significance tests, left blank for rows that were not tested (the market)
+        p_value_columns = {'p_value_annualized_return': 'p (Return)', 'p_value_sharpe_ratio': 'p (Sharpe)', 'p_value_vs_market': 'p (vs Market)'}
+        for row in table_data:
+            p_values = p_values_by_strategy.get(row[0], {})
+            row.extend('' if pd.isna(p_values.get(key, np.nan)) else p_values[key] for key in p_value_columns)
+        columns += list(p_value_columns.values())
+    table = pd.DataFrame(table_data, columns=columns)
     table_data = table.values.tolist()
     # Add header row
     header = table.columns.to_list()
     table_data.insert(0, header)
     return table_data
 
-def main(rankings_directory, start_year=2022, end_year=2022, calculate_top_brands=True, calculate_most_improved_exact=True, calculate_most_improved_weighted=True, calculate_market=True, number_of_brands=10):
-    ticker_mapping = load_ticker_mapping('BrandData/CompanyToTicker_with_tickers.xlsx')
-    
-    if calculate_top_brands:
-        top_brand_monthly_returns, top_brand_yearly_returns, top_brand_stock_details = calculate_returns_for_brands(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands)
-    if calculate_most_improved_exact:
-        most_improved_monthly_returns_exact, most_improved_yearly_returns_exact, most_improved_exact_stock_details = calculate_returns_for_brands(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved=True, weighted=False)
-    if calculate_most_improved_weighted:
-        most_improved_monthly_returns_weighted, most_improved_yearly_returns_weighted, most_improved_weighted_stock_details = calculate_returns_for_brands(ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, most_improved=True, weighted=True)
-    if calculate_market:
-        market_monthly_returns, market_yearly_returns = get_market_monthly_returns('^GSPC', start_year, end_year)
-
-    total_monthly_returns_top_brands, total_monthly_returns_most_improved_exact, total_monthly_returns_most_improved_weighted, total_monthly_returns_market = [], [], [], []
-    total_yearly_returns_top_brands, total_yearly_returns_most_improved_exact, total_yearly_returns_most_improved_weighted, total_yearly_returns_market = [], [], [], []
-
-    for year in range(start_year, end_year+1):
-        print(f"Year: {year}")
-
-        if calculate_top_brands:
-            top_brand_metrics = calculate_performance_metrics(top_brand_monthly_returns.get(year, []))
-            total_monthly_returns_top_brands.extend(top_brand_monthly_returns.get(year, []))
-            total_yearly_returns_top_brands.append(top_brand_yearly_returns.get(year, []))
-            print(f"Top 10 Brands Sharpe Ratio: {top_brand_metrics.get('sharpe_ratio', 'N/A')}, Yearly returns: {top_brand_yearly_returns.get(year, [])}")
-
-        if calculate_most_improved_exact:
-            most_improved_metrics_exact = calculate_performance_metrics(most_improved_monthly_returns_exact.get(year, []))
-            total_monthly_returns_most_improved_exact.extend(most_improved_monthly_returns_exact.get(year, []))
-            total_yearly_returns_most_improved_exact.append(most_improved_yearly_returns_exact.get(year, []))
-            print(f"Top 10 Most Improved Brands Sharpe Ratio (Exact): {most_improved_metrics_exact.get('sharpe_ratio', 'N/A')} Yearly returns: {most_improved_yearly_returns_exact.get(year, [])}")        
-
-        if calculate_most_improved_weighted:
-            most_improved_metrics_weighted = calculate_performance_metrics(most_improved_monthly_returns_weighted.get(year, []))
-            total_monthly_returns_most_improved_weighted.extend(most_improved_monthly_returns_weighted.get(year, []))
-            total_yearly_returns_most_improved_weighted.append(most_improved_yearly_returns_weighted.get(year, []))
-            print(f"Top 10 Most Improved Brands Sharpe Ratio (Weighted): {most_improved_metrics_weighted.get('sharpe_ratio', 'N/A')}, Yearly returns: {most_improved_yearly_returns_weighted.get(year, [])}")
-
-        if calculate_market:        
-            market_metrics = calculate_performance_metrics(market_monthly_returns.get(year, []))
-            total_monthly_returns_market.extend(market_monthly_returns.get(year, []))
-            total_yearly_returns_market.append(market_yearly_returns.get(year, []))
-            print(f"S&P 500 Market Sharpe Ratio: {market_metrics.get('sharpe_ratio', 'N/A')}, Yearly returns: {market_yearly_returns.get(year, [])}")
-
-
-    print("-"*50)
-
-    if calculate_top_brands:
-        net_return_top_brands = calculate_net_returns(total_yearly_returns_top_brands)
-        annualized_return_top_brands = (1 + net_return_top_brands) ** (1/len(total_yearly_returns_top_brands)) - 1
-        net_sharpe_ratio_top_brands = calculate_performance_metrics(total_monthly_returns_top_brands)['sharpe_ratio']
-        print(f"Net Sharpe Ratio for Top 10 Brands: {net_sharpe_ratio_top_brands}, Annualized returns: {annualized_return_top_brands}")
-    
-    if calculate_most_improved_exact:
-        net_return_most_improved_exact = calculate_net_returns(total_yearly_returns_most_improved_exact)
-        annualized_return_most_improved_exact = (1 + net_return_most_improved_exact) ** (1/len(total_yearly_returns_most_improved_exact)) - 1
-        net_sharpe_ratio_most_improved_exact = calculate_performance_metrics(total_monthly_returns_most_improved_exact)['sharpe_ratio']
-        print(f"Net Sharpe Ratio for Most Improved Brands (Exact): {net_sharpe_ratio_most_improved_exact}, Annualized returns: {annualized_return_most_improved_exact}")
-
-    if calculate_most_improved_weighted:
-        net_return_most_improved_weighted = calculate_net_returns(total_yearly_returns_most_improved_weighted)
-        annualized_return_most_improved_weighted = (1 + net_return_most_improved_weighted) ** (1/len(total_yearly_returns_most_improved_weighted)) - 1
-        net_sharpe_ratio_most_improved_weighted = calculate_performance_metrics(total_monthly_returns_most_improved_weighted)['sharpe_ratio']
-        print(f"Net Sharpe Ratio for Most Improved Brands (Weighted): {net_sharpe_ratio_most_improved_weighted}, Annualized returns: {annualized_return_most_improved_weighted}")
-    
+@instrumented()
+def evaluate_strategies(strategy_names, ticker_mapping, start_year, end_year, rankings_directory, number_of_brands, price_cache, result_store,
+                        frequency='1mo', calculate_market=True):
+    """
+    Evaluate registered strategies in one shared pass: select every strategy's tickers, fetch the
+    union of them once and compute all portfolios against one price panel. Returns the
+    results and result store configs keyed by strategy name, with the market under 'market'.
+    """
+    selections = {name: select_strategy_tickers(STRATEGIES[name], ticker_mapping, start_year, end_year, rankings_directory, number_of_brands)
+                  for name in strategy_names}
+    configs = {name: config_key(strategy=name, number_of_brands=number_of_brands, frequency=frequency) for name in strategy_names}
     if calculate_market:
-        net_return_market = calculate_net_returns(total_yearly_returns_market)
-        annualized_return_market = (1 + net_return_market) ** (1/len(total_yearly_returns_market)) - 1
-        net_sharpe_ratio_market = calculate_performance_metrics(total_monthly_returns_market)['sharpe_ratio']
-        print(f"Net Sharpe Ratio for S&P 500 Market: {net_sharpe_ratio_market}, Annualized returns: {annualized_return_market}")
+        selections['market'] = {year: [MARKET_TICKER] for year in range(start_year, end_year + 1)}
+        configs['market'] = config_key(strategy='market', ticker=MARKET_TICKER, frequency=frequency)
 
-    plot_yearly_returns(total_yearly_returns_top_brands, total_yearly_returns_most_improved_exact, total_yearly_returns_most_improved_weighted, total_yearly_returns_market, start_year, end_year)
+    ranking_hashes = get_rankings_store(rankings_directory).file_hashes
+    results = calculate_returns_incremental(selections, configs, start_year, end_year, price_cache, result_store, ranking_hashes, frequency)
+    return results, configs
 
-    plot_cumulative_returns(total_yearly_returns_top_brands, total_yearly_returns_most_improved_exact, total_yearly_returns_most_improved_weighted, total_yearly_returns_market, start_year, end_year)
-    table_data = table_net_returns_and_sharpe_ratios(annualized_return_top_brands, annualized_return_most_improved_exact, annualized_return_most_improved_weighted, annualized_return_market, net_sharpe_ratio_top_brands, net_sharpe_ratio_most_improved_exact, net_sharpe_ratio_most_improved_weighted, net_sharpe_ratio_market)
-    pdf_path = 'data/analysis_report.pdf'
-    create_pdf(pdf_path, table_data, top_brand_stock_details, most_improved_exact_stock_details, most_improved_weighted_stock_details)
+@instrumented()
+def evaluate_significance(results, observed, ticker_mapping, start_year, end_year, rankings_directory, price_cache, frequency='1mo',
+                          simulations=DEFAULT_SIMULATIONS, block_length=None, seed=0, processes=None):
+    """
+    Test every strategy in results except the market against random equal-weighted portfolios of
+    the same size drawn from each year's ranked brands with a ticker, and against the market with
+    block-bootstrapped excess returns, in blocks of half a year of periods of the frequency unless
+    block_length is given. observed maps each strategy name to its rolled metrics. Returns the p-values of each strategy keyed by name.
+    """
+    store = get_rankings_store(rankings_directory)
+    years = range(start_year, end_year + 1)
+    universe_tickers = {year: get_tickers_for_brands(ticker_mapping, store.year(year)['brand'], year) for year in years}
+    tickers = list(dict.fromkeys(ticker for year_tickers in universe_tickers.values() for ticker in year_tickers))
+    panel = ReturnsPanel.from_cache(price_cache, tickers, start_year, end_year, frequency)
+    universes = [year_universe(panel, year, universe_tickers[year]) for year in years]
+
+    strategies = {}
+    for name, (monthly_returns, _, stock_details) in results.items():
+        if name == 'market':
+            continue
+        sizes = [len(stock_details.get(year, [])) for year in years]
+        excess_returns = None
+        if 'market' in results:
+            market_monthly = results['market'][0]
+            # Aligned by date, over the dates both the strategy and the market have a return
+            excess_returns = np.concatenate([(monthly_returns[year] - market_monthly[year]).dropna().to_numpy() for year in years
+                                             if year in monthly_returns and year in market_monthly] or [np.empty(0)])
+        strategies[name] = (sizes, excess_returns, observed[name])
+
+    print(f"Running {simulations} random portfolios per strategy for the significance tests")
+    return significance_tests(universes, strategies, simulations, block_length, PERIODS_PER_YEAR[frequency], seed, processes)
+
+def main(rankings_directory, start_year=2022, end_year=2022, calculate_top_brands=True, calculate_most_improved_exact=True, calculate_most_improved_weighted=True, calculate_market=True, number_of_brands=10, offline=None, price_cache_path=DEFAULT_CACHE_PATH, price_provider=None, result_store_path=DEFAULT_RESULT_STORE_PATH, profile_path=None, cprofile=False, track_memory=False, frequency='1mo', strategies=None, report_formats=('pdf',), report_directory='data', significance_simulations=0, significance_seed=0, processes=None, parallel_charts=False, mapping_path=DEFAULT_MAPPING_PATH, normalized_ticker_matching=False, rolling_window=None, metrics_directory=None):
+    # frequency '1d' computes every metric from daily instead of monthly returns
+    periods_per_year = PERIODS_PER_YEAR[frequency]
+    # Time, call counts, cache and network counters and memory of every stage are written to profile_path,
+    # by default run_profile.json in report_directory
+    if profile_path is None:
+        profile_path = os.path.join(report_directory, 'run_profile.json')
+    profiler = Profiler(track_memory=track_memory, cprofile=cprofile)
+    set_profiler(profiler)
+    profiler.start()
+
+    try:
+        # Everything the run does is inside the main stage, so counters outside any other stage are attributed to it
+        with profiler.stage('main'):
+            # strategies is a list of registered strategy names; by default the calculate_* flags pick the original three
+            if strategies is None:
+                flags = [calculate_top_brands, calculate_most_improved_exact, calculate_most_improved_weighted]
+                strategies = [name for name, enabled in zip(DEFAULT_STRATEGIES, flags) if enabled]
+
+            # Prices are served from the local cache; in offline mode the network is never touched.
+            # offline=None follows BRANDSTOCK_OFFLINE, so air-gapped runs need no code change
+            price_cache = PriceCache(price_cache_path, offline=offline, provider=price_provider)
+            set_price_cache(price_cache)
+            # Results of past years are reused from the result store; None keeps them in memory for this run only
+            result_store = ResultStore(result_store_path or ':memory:')
+            # Tickers come from exact brand names and the mapping's aliases; normalized_ticker_matching also matches names
+            # that only differ in case, punctuation or corporate suffixes, which is not vetted (see inexact_matches)
+            ticker_mapping = load_ticker_mapping(mapping_path, normalized_ticker_matching)
+            # Share of ranked brands with a ticker, the brands without one, to grow the mapping from, and the brands whose
+            # ticker would only come from a normalized name, to review and add as aliases
+            rankings_table = get_rankings_store(rankings_directory).table
+            coverage, unmapped = unmapped_brands(ticker_mapping, rankings_table)
+            inexact = inexact_matches(ticker_mapping, rankings_table)
+            os.makedirs(report_directory, exist_ok=True)
+            unmapped_path = os.path.join(report_directory, 'unmapped_brands.csv')
+            inexact_path = os.path.join(report_directory, 'inexact_ticker_matches.csv')
+            unmapped.to_csv(unmapped_path)
+            inexact.to_csv(inexact_path, index=False)
+            print(f"Ticker coverage of ranked brands {start_year}-{end_year}: {coverage.loc[start_year:end_year].mean():.1%}, "
+                  f"{len(unmapped)} unmapped brands saved to: {unmapped_path}")
+            print(f"{len(inexact)} brands that only match by normalized name, {'used' if normalized_ticker_matching else 'not used'}, "
+                  f"saved to: {inexact_path}")
+
+            results, configs = evaluate_strategies(strategies, ticker_mapping, start_year, end_year, rankings_directory, number_of_brands,
+                                                   price_cache, result_store, frequency, calculate_market)
+            labels = {name: STRATEGIES[name].label for name in strategies}
+            if calculate_market:
+                labels['market'] = 'S&P 500 Market'
+
+            # Period returns of every strategy and the market as one (periods x strategies) array, memory-mapped in
+            # metrics_directory if given, so every metric is computed in a single streaming pass
+            names = list(results)
+            returns_path = os.path.join(metrics_directory, 'returns.npy') if metrics_directory else None
+            if metrics_directory:
+                os.makedirs(metrics_directory, exist_ok=True)
+            period_returns, row_years = stack_returns(results, start_year, end_year, returns_path)
+            sharpe_ratios = yearly_sharpe_ratios(period_returns, row_years, periods_per_year)
+
+            total_yearly_returns = {name: [] for name in results}
+            for year in range(start_year, end_year+1):
+                print(f"Year: {year}")
+                for column, (name, (_, yearly_returns, _)) in enumerate(results.items()):
+                    # Years without data are plotted as flat years
+                    total_yearly_returns[name].append(yearly_returns.get(year, 0))
+                    sharpe_ratio = sharpe_ratios[year][column] if year in sharpe_ratios else 'N/A'
+                    print(f"{labels[name]} Sharpe Ratio: {sharpe_ratio}, Yearly returns: {yearly_returns.get(year, [])}")
+
+            print("-"*50)
+
+            net_metrics = {}
+            rolled_metrics = {}
+            for name in results:
+                # Rolled forward from the stored per-year aggregates instead of replaying every year
+                metrics = result_store.rolled_metrics(configs[name], start_year, end_year, periods_per_year)
+                print(f"Net Sharpe Ratio for {labels[name]}: {metrics['sharpe_ratio']}, Annualized returns: {metrics['annualized_return']}")
+                net_metrics[labels[name]] = (metrics['annualized_return'], metrics['sharpe_ratio'])
+                rolled_metrics[name] = metrics
+
+            # significance_simulations random portfolios per strategy (e.g. 100000) give each strategy p-values; 0 skips the tests
+            p_values = None
+            if significance_simulations:
+                significance = evaluate_significance(results, rolled_metrics, ticker_mapping, start_year, end_year, rankings_directory, price_cache,
+                                                     frequency, significance_simulations, seed=significance_seed, processes=processes)
+                p_values = {labels[name]: tests for name, tests in significance.items()}
+                for label, tests in p_values.items():
+                    print(f"p-values for {label}: annualized return {tests['p_value_annualized_return']}, Sharpe ratio {tests['p_value_sharpe_ratio']}, "
+                          f"vs market {tests['p_value_vs_market']}")
+
+            # Full-period risk metrics of every strategy, with beta against the market. rolling_window adds the metrics of every
+            # trailing window of that many periods, saved to rolling_metrics.csv in report_directory
+            benchmark = period_returns[:, names.index('market')] if 'market' in results else None
+            risk_metrics = compute_metrics(period_returns, periods_per_year, benchmark, rolling_window=rolling_window, out_directory=metrics_directory)
+            for column, name in enumerate(names):
+                if name != 'market' and risk_metrics['periods'][column]:
+                    print(f"Risk metrics for {labels[name]}: {int(risk_metrics['periods'][column])} periods, mean: {risk_metrics['mean_return'][column]}, "
+                          f"Sharpe: {risk_metrics['sharpe_ratio'][column]}, Sortino: {risk_metrics['sortino_ratio'][column]}, "
+                          f"Max drawdown: {risk_metrics['max_drawdown'][column]}, Historical VaR: {risk_metrics['historical_var'][column]}, "
+                          f"Beta: {risk_metrics['beta'][column] if 'beta' in risk_metrics else 'N/A'}")
+            if rolling_window:
+                rolling = rolling_metrics_frame(risk_metrics, row_years, [labels[name] for name in names])
+                rolling_path = os.path.join(report_directory, 'rolling_metrics.csv')
+                rolling.to_csv(rolling_path, index=False)
+                for label, latest in rolling.groupby('strategy', sort=False).last().iterrows():
+                    print(f"Latest {rolling_window}-period rolling Sharpe ratio for {label}: {latest['rolling_sharpe_ratio']}")
+                print(f"Rolling metrics saved to: {rolling_path}")
+
+            yearly_returns_by_strategy = {labels[name]: total_yearly_returns[name] for name in results}
+            table_data = table_net_returns_and_sharpe_ratios(net_metrics, p_values)
+            # report_formats is any of 'pdf', 'html' and 'csv'; charts and outputs whose data is unchanged are not rendered again.
+            # parallel_charts draws the charts in separate processes, which pays off when drawing them takes longer than starting a pool
+            from report import render_report
+            report_paths = render_report(table_data, yearly_returns_by_strategy, {labels[name]: results[name][2] for name in strategies},
+                                         start_year, end_year, report_directory, report_formats, parallel_charts)
+            for path in report_paths:
+                print(f'Report saved to: {path}')
+    finally:
+        # A failed run still stops profiling and tracemalloc and clears the global profiler
+        profiler.stop()
+        set_profiler(None)
+    print(f'Run profile saved to: {profiler.write(profile_path)}')
 
 if __name__ == "__main__":
     rankings_directory = 'BrandData'
-    main(rankings_directory, start_year=2015, end_year=2023, calculate_top_brands=True, calculate_most_improved_exact=True, calculate_most_improved_weighted=True, calculate_market=True, number_of_brands=20)
\ No newline at end of file
+    main(rankings_directory, start_year=2015, end_year=2023, calculate_top_brands=True, calculate_most_improved_exact=True, calculate_most_improved_weighted=True, calculate_market=True, number_of_brands=20)
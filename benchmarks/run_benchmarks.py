@@ -0,0 +1,219 @@
+"""
+Times every stage of the analysis pipeline on synthetic rankings and prices, records peak
+memory per stage and compares the results against benchmarks/baselines.json.
+
+Runs entirely offline: prices are read from local CSVs through FilePriceProvider.
+
+    python benchmarks/run_benchmarks.py --profile small
+    python benchmarks/run_benchmarks.py --brands 10000 --years 50 --tickers 3000 --frequency 1d
+    python benchmarks/run_benchmarks.py --profile small --update-baseline
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIRECTORY))
+
+import matplotlib
+matplotlib.use('Agg')
+
+import analysis_script
+import synthetic_data
+from price_cache import PriceCache
+from rankings_store import RankingsStore
+from returns_panel import ReturnsPanel
+from ticker_index import TickerIndex
+
+# analysis_script imports the report module on first use; import it here so the report stages time rendering only
+importlib.import_module('report')
+
+BASELINES_PATH = os.path.join(BENCHMARK_DIRECTORY, 'baselines.json')
+END_YEAR = 2023
+
+PROFILES = {
+    'small': {'brands': 500, 'years': 10, 'tickers': 300, 'frequency': '1mo', 'number_of_brands': 20},
+    'medium': {'brands': 2000, 'years': 25, 'tickers': 1000, 'frequency': '1mo', 'number_of_brands': 100},
+    'large': {'brands': 10000, 'years': 50, 'tickers': 3000, 'frequency': '1d', 'number_of_brands': 500},
+}
+
+STRATEGIES = [
+    ('Top Brands', False, False),
+    ('Most Improved Brands (Exact)', True, False),
+    ('Most Improved Brands (Weighted)', True, True),
+]
+
+
+class StageTimer:
+    """
+    Records wall time and peak traced memory of each stage run inside stage(name), counted from
+    the memory already held when the stage starts, so leftovers of earlier stages are not counted.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        tracemalloc.reset_peak()
+        # Memory still held by earlier stages is not this stage's, so the peak is measured from here
+        held = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        # Silence the pipeline's progress prints so they do not dominate the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        seconds = time.perf_counter() - start
+        peak_mb = (tracemalloc.get_traced_memory()[1] - held) / 2 ** 20
+        self.results[name] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 2)}
+        print(f'{name:<32} {seconds:>9.3f}s {peak_mb:>10.1f} MB')
+
+
+def run(config, work_directory):
+    start_year = END_YEAR - config['years'] + 1
+    interval = config['frequency']
+    rankings_directory = os.path.join(work_directory, 'rankings')
+    timer = StageTimer()
+    tracemalloc.start()
+
+    with timer.stage('generate_rankings'):
+        synthetic_data.write_rankings(rankings_directory, config['brands'], start_year, END_YEAR)
+    mapping = synthetic_data.ticker_mapping(config['brands'], config['tickers'])
+    with timer.stage('generate_prices'):
+        provider = synthetic_data.write_prices(os.path.join(work_directory, 'prices'), set(mapping.values()) - {'N/A'},
+                                               start_year, END_YEAR, interval)
+    with timer.stage('compile_ticker_index'):
+        ticker_mapping = TickerIndex.from_mapping(mapping)
+
+    with timer.stage('load_rankings_cold'):
+        RankingsStore(rankings_directory)
+    with timer.stage('load_brand_rankings'):
+        for year in range(start_year, END_YEAR + 1):
+            for _, most_improved, weighted in STRATEGIES:
+                analysis_script.load_brand_rankings(year, rankings_directory, most_improved, weighted, config['number_of_brands'])
+
+    price_cache = PriceCache(os.path.join(work_directory, 'price_cache.sqlite'), provider=provider)
+    selections = {}
+    with timer.stage('select_tickers'):
+        for name, most_improved, weighted in STRATEGIES:
+            selections[name] = analysis_script.select_tickers_by_year(
+                ticker_mapping, start_year, END_YEAR, rankings_directory, config['number_of_brands'], most_improved, weighted)
+    tickers = [ticker for by_year in selections.values() for year_tickers in by_year.values() for ticker in year_tickers]
+    with timer.stage('fetch_prices_cold'):
+        ReturnsPanel.from_cache(price_cache, tickers + [analysis_script.MARKET_TICKER], start_year, END_YEAR, interval)
+    with timer.stage('build_panel_warm'):
+        panel = ReturnsPanel.from_cache(price_cache, tickers + [analysis_script.MARKET_TICKER], start_year, END_YEAR, interval)
+
+    results = {}
+    with timer.stage('calculate_returns_for_brands'):
+        for name, most_improved, weighted in STRATEGIES:
+            results[name] = analysis_script.calculate_returns_for_brands(
+                ticker_mapping, start_year, END_YEAR, rankings_directory, config['number_of_brands'], most_improved, weighted, panel=panel)
+    with timer.stage('market_returns'):
+        market_monthly, market_yearly, _ = panel.portfolio_returns({'market': {year: [analysis_script.MARKET_TICKER] for year in range(start_year, END_YEAR + 1)}},
+                                                                   start_year, END_YEAR)['market']
+
+    years = range(start_year, END_YEAR + 1)
+    yearly = {name: [result[1].get(year, 0) for year in years] for name, result in results.items()}
+    yearly['S&P 500 Market'] = [market_yearly.get(year, 0) for year in years]
+    with timer.stage('calculate_performance_metrics'):
+        for name, result in results.items():
+            analysis_script.calculate_performance_metrics([r for year in years for r in result[0].get(year, [])])
+            for year in years:
+                analysis_script.calculate_performance_metrics(result[0].get(year, []))
+        table_data = analysis_script.table_net_returns_and_sharpe_ratios({name: (0.0, 0.0) for name in yearly})
+
+    # The plotting and PDF functions write to data/ relative to the working directory
+    os.makedirs(os.path.join(work_directory, 'data'), exist_ok=True)
+    previous_directory = os.getcwd()
+    os.chdir(work_directory)
+    try:
+        with timer.stage('plot_cumulative_returns'):
+            analysis_script.plot_cumulative_returns(yearly, start_year, END_YEAR)
+        with timer.stage('plot_yearly_returns'):
+            analysis_script.plot_yearly_returns(yearly, start_year, END_YEAR)
+        with timer.stage('create_pdf'):
+            analysis_script.create_pdf('data/analysis_report.pdf', table_data, {name: result[2] for name, result in results.items()})
+        # A full render into a fresh directory, then the same render again with every output unchanged
+        for stage_name in ('render_report', 'render_report_cached'):
+            with timer.stage(stage_name):
+                analysis_script.render_report(table_data, yearly, {name: result[2] for name, result in results.items()}, start_year, END_YEAR,
+                                              'report', formats=('pdf', 'html', 'csv'))
+    finally:
+        os.chdir(previous_directory)
+    tracemalloc.stop()
+    return timer.results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the stages whose time or peak memory exceeds the baseline by more than tolerance.
+    """
+    regressions = []
+    for stage, measured in results.items():
+        expected = baseline.get(stage)
+        if expected is None:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            # Ignore noise on stages that take almost no time or memory
+            floor = 0.05 if metric == 'seconds' else 1.0
+            if measured[metric] > max(expected[metric], floor) * (1 + tolerance):
+                regressions.append(f'{stage} {metric}: {measured[metric]} vs baseline {expected[metric]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline on synthetic data.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='small')
+    parser.add_argument('--brands', type=int)
+    parser.add_argument('--years', type=int)
+    parser.add_argument('--tickers', type=int)
+    parser.add_argument('--frequency', choices=sorted(synthetic_data.FREQUENCIES))
+    parser.add_argument('--number-of-brands', type=int)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown before a stage counts as a regression')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    config = dict(PROFILES[args.profile])
+    for key in ('brands', 'years', 'tickers', 'frequency', 'number_of_brands'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    # Baselines only apply to the unmodified profiles
+    name = args.profile if config == PROFILES[args.profile] else None
+    print(f'Benchmark config: {config}')
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        results = run(config, work_directory)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    if args.update_baseline:
+        if name is None:
+            parser.error('--update-baseline needs an unmodified --profile')
+        baselines[name] = results
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'Baseline for {name} saved to: {BASELINES_PATH}')
+        return 0
+    if name is None or name not in baselines:
+        print('No baseline to compare against')
+        return 0
+
+    regressions = compare(results, baselines[name], args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if not regressions:
+        print(f'No regressions against the {name} baseline')
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
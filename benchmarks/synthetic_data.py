@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from price_providers import FilePriceProvider
+
+RATINGS = ['AAA+', 'AAA', 'AAA-', 'AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+', 'BBB', 'BBB-']
+FREQUENCIES = {'1mo': 'MS', '1d': 'B'}
+RANKED_BRANDS_PER_YEAR = 500
+
+
+def brand_names(number_of_brands):
+    return [f'Brand {i:05d}' for i in range(number_of_brands)]
+
+
+def write_rankings(directory, number_of_brands, start_year, end_year, seed=0):
+    """
+    Write one brandirectory-format ranking CSV per year. Each year ranks a random subset of
+    up to 500 brands, with previous positions and values carried over from the year before.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    brands = np.array(brand_names(number_of_brands))
+    ranked = min(RANKED_BRANDS_PER_YEAR, number_of_brands)
+    previous = None
+    for year in range(start_year, end_year + 1):
+        # Mostly the same brands as last year, with some churn so most-improved selection has work to do
+        if previous is None:
+            chosen = rng.choice(number_of_brands, ranked, replace=False)
+        else:
+            kept = rng.choice(previous.index.to_numpy(), int(ranked * 0.9), replace=False)
+            newcomers = rng.choice(np.setdiff1d(np.arange(number_of_brands), kept), ranked - len(kept), replace=False)
+            chosen = np.concatenate([kept, newcomers])
+        values = np.round(np.sort(rng.lognormal(9, 1, ranked))[::-1], 2)
+        ratings = rng.choice(RATINGS, ranked)
+        # Brands that were not ranked last year get the "-" placeholder of the real files
+        previous_position = np.full(ranked, '-', dtype=object)
+        previous_value = np.full(ranked, '-', dtype=object)
+        previous_rating = np.full(ranked, '-', dtype=object)
+        if previous is not None:
+            carried = np.isin(chosen, previous.index)
+            previous_position[carried] = previous.loc[chosen[carried], 'Position'].to_numpy()
+            previous_value[carried] = previous.loc[chosen[carried], 'Brand Value ($M)'].to_numpy()
+            previous_rating[carried] = previous.loc[chosen[carried], 'Rating'].to_numpy()
+        rankings = pd.DataFrame({
+            'Brand': brands[chosen],
+            'Position': np.arange(1, ranked + 1),
+            'Previous Position': previous_position,
+            'Brand Value ($M)': values,
+            'Previous Brand Value ($M)': previous_value,
+            'Rating': ratings,
+            'Previous Rating': previous_rating,
+            'Year': '',
+            'Previous Year': '',
+        }, index=chosen)
+        rankings.to_csv(os.path.join(directory, f'brandirectory-ranking-data-global-{year}.csv'), index=False)
+        previous = rankings
+    return directory
+
+
+def ticker_mapping(number_of_brands, number_of_tickers, unmapped_fraction=0.1, seed=0):
+    """
+    Map brands to number_of_tickers tickers, several brands per ticker, with a fraction of
+    brands left unmapped ('N/A') as in CompanyToTicker_with_tickers.xlsx.
+    """
+    rng = np.random.default_rng(seed)
+    tickers = np.array([f'T{i:05d}' for i in range(number_of_tickers)])
+    assigned = tickers[rng.integers(0, number_of_tickers, number_of_brands)].astype(object)
+    assigned[rng.random(number_of_brands) < unmapped_fraction] = 'N/A'
+    return dict(zip(brand_names(number_of_brands), assigned))
+
+
+def write_prices(directory, tickers, start_year, end_year, interval='1mo', seed=0):
+    """
+    Write a random-walk price history for every ticker, plus ^GSPC, in FilePriceProvider format.
+    """
+    rng = np.random.default_rng(seed)
+    provider = FilePriceProvider(directory)
+    dates = pd.date_range(f'{start_year-1}-12-01', f'{end_year}-12-31', freq=FREQUENCIES[interval])
+    periods_per_year = 12 if interval == '1mo' else 252
+    # Sorted, so each ticker gets the same prices for a seed whatever order tickers (e.g. a set) iterate in
+    for ticker in sorted(tickers) + ['^GSPC']:
+        returns = rng.normal(0.08 / periods_per_year, 0.3 / np.sqrt(periods_per_year), len(dates))
+        provider.write(ticker, pd.Series(100 * np.cumprod(1 + returns), index=dates), interval)
+    return provider
@@ -0,0 +1,199 @@
+"""
+Command line interface to the analysis.
+
+    python cli.py fetch --start-year 2015 --end-year 2023 --number-of-brands 20
+    python cli.py backtest --start-year 2015 --end-year 2023 --strategies top_brands value_weighted --offline
+    python cli.py sweep --brand-counts 10 20 50
+    python cli.py report --formats pdf html --significance-simulations 100000
+    python cli.py serve --port 8765
+
+Each command imports only the modules it needs, so fetch and backtest never load matplotlib
+or reportlab. serve keeps the rankings and prices in memory and answers queries over HTTP.
+"""
+import argparse
+import contextlib
+import json
+import sys
+
+DEFAULT_RANKINGS_DIRECTORY = 'BrandData'
+
+
+def fetch(args):
+    from analysis_script import MARKET_TICKER, load_ticker_mapping, select_strategy_tickers
+    from price_cache import PriceCache
+    from rankings_store import get_rankings_store
+    from returns_panel import year_window
+    from strategies import STRATEGIES
+
+    ticker_mapping = load_ticker_mapping(args.mapping, args.normalized_matching)
+    if args.all_ranked:
+        # Every ranked brand with a ticker, as needed by the significance tests and the server
+        table = get_rankings_store(args.rankings_directory).table
+        table = table[(table['year'] >= args.start_year) & (table['year'] <= args.end_year)]
+        tickers = ticker_mapping.join(table[['brand', 'year']])['ticker'].dropna().unique().tolist()
+    else:
+        tickers = [ticker for name in args.strategies
+                   for year_tickers in select_strategy_tickers(STRATEGIES[name], ticker_mapping, args.start_year, args.end_year,
+                                                               args.rankings_directory, args.number_of_brands).values()
+                   for ticker in year_tickers]
+    tickers = list(dict.fromkeys(tickers + [MARKET_TICKER]))
+
+    # Fetching is the point of this command, so it is online even under BRANDSTOCK_OFFLINE
+    price_cache = PriceCache(args.price_cache, offline=False)
+    price_cache.prefetch(tickers, year_window(args.start_year, args.frequency)[0], year_window(args.end_year, args.frequency)[1], args.frequency)
+    print(f'Prices of {len(tickers)} tickers cached in {args.price_cache} with {price_cache.network_requests} network requests')
+
+
+def backtest(args):
+    from analysis_script import evaluate_strategies, load_ticker_mapping
+    from metrics import PERIODS_PER_YEAR
+    from price_cache import PriceCache
+    from result_store import ResultStore
+
+    price_cache = PriceCache(args.price_cache, offline=args.offline)
+    result_store = ResultStore(args.result_store)
+    # Progress goes to stderr so stdout holds only the results
+    with contextlib.redirect_stdout(sys.stderr):
+        results, configs = evaluate_strategies(args.strategies, load_ticker_mapping(args.mapping, args.normalized_matching), args.start_year, args.end_year,
+                                               args.rankings_directory, args.number_of_brands, price_cache, result_store, args.frequency,
+                                               calculate_market=not args.no_market)
+    metrics = {name: result_store.rolled_metrics(configs[name], args.start_year, args.end_year, PERIODS_PER_YEAR[args.frequency])
+               for name in results}
+    if args.json:
+        print(json.dumps(metrics, indent=2))
+        return
+    print(f"{'':<28} {'Net Return':>12} {'Annualized':>12} {'Sharpe':>8}")
+    for name, values in metrics.items():
+        print(f"{name:<28} {values['net_return']:>12.2%} {values['annualized_return']:>12.2%} {values['sharpe_ratio']:>8.3f}")
+
+
+def sweep(args):
+    from sweep import run_sweep
+
+    options = {'brand_counts': args.brand_counts} if args.brand_counts else {}
+    run_sweep(args.rankings_directory, start_years=args.start_years, end_years=args.end_years, processes=args.processes,
+              mapping_path=args.mapping, normalized_ticker_matching=args.normalized_matching,
+              offline=args.offline, price_cache_path=args.price_cache, output_path=args.output, **options)
+
+
+def report(args):
+    from analysis_script import main
+
+    main(args.rankings_directory, start_year=args.start_year, end_year=args.end_year, number_of_brands=args.number_of_brands,
+         calculate_market=not args.no_market, offline=args.offline, price_cache_path=args.price_cache, result_store_path=args.result_store,
+         frequency=args.frequency, strategies=args.strategies, report_formats=args.formats, report_directory=args.report_directory,
+         significance_simulations=args.significance_simulations, significance_seed=args.seed, processes=args.processes,
+         parallel_charts=args.parallel_charts, mapping_path=args.mapping, normalized_ticker_matching=args.normalized_matching,
+         rolling_window=args.rolling_window, metrics_directory=args.metrics_directory, cprofile=args.cprofile, track_memory=args.track_memory)
+
+
+def serve(args):
+    from server import serve
+
+    # The server is offline unless started with --online
+    serve(args.host, args.port, rankings_directory=args.rankings_directory, mapping_path=args.mapping, offline=args.offline is not False,
+          price_cache_path=args.price_cache, frequency=args.frequency, normalized_ticker_matching=args.normalized_matching)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Backtest stock portfolios built from brand rankings.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--rankings-directory', default=DEFAULT_RANKINGS_DIRECTORY)
+    # Defaults of None are filled in by apply_defaults
+    common.add_argument('--price-cache')
+    # Without --offline, the BRANDSTOCK_OFFLINE environment variable decides
+    common.add_argument('--offline', action='store_true', default=None, help='use cached prices only, never the network')
+
+    interval = argparse.ArgumentParser(add_help=False)
+    interval.add_argument('--frequency', choices=['1mo', '1wk', '1d'], default='1mo')
+
+    mapping = argparse.ArgumentParser(add_help=False)
+    mapping.add_argument('--mapping', help='brand-to-ticker spreadsheet')
+    mapping.add_argument('--normalized-matching', action='store_true',
+                         help='also match brands on normalized names, whose tickers are not vetted (see inexact_ticker_matches.csv)')
+
+    window = argparse.ArgumentParser(add_help=False)
+    window.add_argument('--start-year', type=int, default=2015)
+    window.add_argument('--end-year', type=int, default=2023)
+    window.add_argument('--number-of-brands', type=int, default=20)
+    window.add_argument('--strategies', nargs='+', help='registered strategy names')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    command = subparsers.add_parser('fetch', parents=[common, mapping, interval, window], help='download prices into the cache')
+    command.add_argument('--all-ranked', action='store_true', help='fetch every ranked brand with a ticker, not just the selected ones')
+    command.set_defaults(handler=fetch)
+
+    command = subparsers.add_parser('backtest', parents=[common, mapping, interval, window], help='print net metrics of strategies, without a report')
+    command.add_argument('--result-store')
+    command.add_argument('--no-market', action='store_true')
+    command.add_argument('--json', action='store_true')
+    command.set_defaults(handler=backtest)
+
+    command = subparsers.add_parser('sweep', parents=[common, mapping], help='evaluate every brand count and year window')
+    command.add_argument('--brand-counts', type=int, nargs='+')
+    command.add_argument('--start-years', type=int, nargs='+')
+    command.add_argument('--end-years', type=int, nargs='+')
+    command.add_argument('--processes', type=int)
+    command.add_argument('--output', default='data/sweep_results.csv')
+    command.set_defaults(handler=sweep)
+
+    command = subparsers.add_parser('report', parents=[common, mapping, interval, window], help='run the full analysis and render the report')
+    command.add_argument('--result-store')
+    command.add_argument('--no-market', action='store_true')
+    command.add_argument('--formats', nargs='+', choices=['pdf', 'html', 'csv'], default=['pdf'])
+    command.add_argument('--parallel-charts', action='store_true', help='draw the charts in separate processes')
+    command.add_argument('--report-directory', default='data')
+    command.add_argument('--significance-simulations', type=int, default=0, help='random portfolios per strategy, e.g. 100000')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--processes', type=int)
+    command.add_argument('--rolling-window', type=int, help='periods per rolling window, saved to rolling_metrics.csv')
+    command.add_argument('--metrics-directory', help='memory-map the returns and rolling metrics as .npy files here')
+    # The run profile is written to run_profile.json in the report directory; these add to it
+    command.add_argument('--cprofile', action='store_true', help='also save cProfile stats of every function next to the run profile')
+    command.add_argument('--track-memory', action='store_true', help='record the peak traced memory of every stage (slower)')
+    command.set_defaults(handler=report)
+
+    command = subparsers.add_parser('serve', parents=[common, mapping, interval], help='answer backtest queries over HTTP from memory')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8765)
+    # --offline is shared with the other commands through the parent parser, so its default is not changed here
+    command.add_argument('--online', dest='offline', action='store_false', default=None, help='fetch missing prices when starting')
+    command.set_defaults(handler=serve)
+    return parser
+
+
+def apply_defaults(parser, args):
+    """
+    Fill in the defaults owned by the modules that use them and check the options. Those
+    modules import pandas, so they are only imported once a command runs, never for --help.
+    """
+    from price_cache import DEFAULT_CACHE_PATH
+    from result_store import DEFAULT_RESULT_STORE_PATH
+    from ticker_index import DEFAULT_MAPPING_PATH
+
+    if args.command == 'fetch' and args.offline:
+        parser.error('fetch downloads prices into the cache and cannot run --offline')
+    args.price_cache = args.price_cache or DEFAULT_CACHE_PATH
+    args.mapping = args.mapping or DEFAULT_MAPPING_PATH
+    if 'result_store' in args:
+        args.result_store = args.result_store or DEFAULT_RESULT_STORE_PATH
+    if 'strategies' in args:
+        from strategies import DEFAULT_STRATEGIES, STRATEGIES
+
+        unknown = [name for name in args.strategies or [] if name not in STRATEGIES]
+        if unknown:
+            parser.error(f"unknown strategies: {', '.join(unknown)} (choose from {', '.join(STRATEGIES)})")
+        args.strategies = args.strategies or list(DEFAULT_STRATEGIES)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    apply_defaults(parser, args)
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
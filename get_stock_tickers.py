@@ -1,51 +1,157 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import requests
-import time
+from requests.adapters import HTTPAdapter
 
-def get_ticker(company_name):
-    yfinance = "https://query2.finance.yahoo.com/v1/finance/search"
-    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
-    params = {"q": company_name, "quotes_count": 10, "country": "United States"}
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
 
-    res = requests.get(url=yfinance, params=params, headers={'User-Agent': user_agent})
-    data = res.json()
+# Lists of U.S. exchange codes, with major exchanges prioritized
+MAJOR_US_EXCHANGES = ['NYQ', 'NMS', 'NGM', 'ASE', 'NYE', 'AMX', 'BATS', 'CBOE', 'IEXG']
+OTC_EXCHANGES = ['OTC', 'OTCQB', 'OTCQX', 'PINK']
 
-    # Lists of U.S. exchange codes, with major exchanges prioritized
-    major_us_exchanges = ['NYQ', 'NMS', 'NGM', 'ASE', 'NYE', 'AMX', 'BATS', 'CBOE', 'IEXG']
-    otc_exchanges = ['OTC', 'OTCQB', 'OTCQX', 'PINK']
 
+def pick_ticker(data):
     # First, search in major exchanges
     for quote in data.get('quotes', []):
-        if quote.get('exchange') in major_us_exchanges:
+        if quote.get('exchange') in MAJOR_US_EXCHANGES:
             return quote.get('symbol', 'N/A')
 
     # If not found, search in OTC exchanges
     for quote in data.get('quotes', []):
-        if quote.get('exchange') in otc_exchanges:
+        if quote.get('exchange') in OTC_EXCHANGES:
             return quote.get('symbol', 'N/A')
-    
+
     return 'N/A'
 
-def find_stock_tickers(file_path):
-    # Load the Excel file
+
+def get_ticker(company_name, session=None, url=YAHOO_SEARCH_URL):
+    params = {"q": company_name, "quotes_count": 10, "country": "United States"}
+    res = (session or requests).get(url=url, params=params, headers={'User-Agent': USER_AGENT}, timeout=30)
+    res.raise_for_status()
+    return pick_ticker(res.json())
+
+
+class TokenBucket:
+    """
+    Allows up to rate requests per second on average, with bursts of up to capacity requests.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TickerLookupCache:
+    """
+    Per-brand ticker lookups persisted as JSON, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lookups = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.lookups = json.load(f)
+
+    def __contains__(self, brand):
+        return brand in self.lookups
+
+    def get(self, brand):
+        return self.lookups.get(brand)
+
+    def set(self, brand, ticker):
+        self.lookups[brand] = ticker
+
+    def save(self):
+        # Write to a temporary file first so a crash mid-write never corrupts the checkpoint
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.lookups, f, indent=0, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+
+async def resolve_tickers(brands, cache, url=YAHOO_SEARCH_URL, rate=2.0, concurrency=8, checkpoint_every=50):
+    """
+    Look up the ticker of every brand not in the cache, with at most concurrency requests in
+    flight and rate requests per second overall. The cache is saved every checkpoint_every lookups.
+    """
+    pending = [brand for brand in dict.fromkeys(brands) if brand not in cache]
+    print(f'{len(pending)} brands to resolve, {len(cache.lookups)} already cached')
+    if not pending:
+        return
+
+    bucket = TokenBucket(rate)
+    session = requests.Session()
+    # pool_maxsize keeps up to one connection per worker thread open to the search host, reused for every
+    # request; pool_connections is the number of hosts to keep pools for, and there is only one
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    for brand in pending:
+        queue.put_nowait(brand)
+    completed = 0
+
+    async def worker():
+        nonlocal completed
+        while not queue.empty():
+            brand = queue.get_nowait()
+            await bucket.acquire()
+            try:
+                ticker = await loop.run_in_executor(executor, get_ticker, brand, session, url)
+            except Exception as e:
+                # Failed lookups are not cached, so they are retried on the next run
+                print(f'Lookup failed for {brand}: {e}')
+                continue
+            cache.set(brand, ticker)
+            print(f'Ticker for {brand}: {ticker}')
+            completed += 1
+            if completed % checkpoint_every == 0:
+                cache.save()
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        try:
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+        finally:
+            cache.save()
+            session.close()
+
+
+def find_stock_tickers(file_path, cache_path=None, url=YAHOO_SEARCH_URL, rate=2.0, concurrency=8, checkpoint_every=50):
     df = pd.read_csv(file_path)
+    cache = TickerLookupCache(cache_path or file_path.replace('.csv', '_ticker_lookups.json'))
 
-    # Iterate over the company names and search for their stock tickers
-    for index, row in df.iterrows():
-        print(f'Searching for ticker of {row["Brand"]}..., {index}')
-        ticker = get_ticker(row['Brand'])
-        df.at[index, 'Ticker'] = ticker
-        # Sleep for 0.5 seconds to avoid getting blocked by Yahoo Finance
-        time.sleep(0.5)
-        print(f'Ticker for {row["Brand"]}: {ticker}')
+    asyncio.run(resolve_tickers(df['Brand'], cache, url, rate, concurrency, checkpoint_every))
 
-    # Save the updated dataframe back to Excel
+    df['Ticker'] = [cache.get(brand) for brand in df['Brand']]
     updated_file_path = file_path.replace('.csv', '_with_tickers.csv')
     df.to_csv(updated_file_path, index=False)
     return updated_file_path
 
-# Call the function with the path to your Excel file
-file_path = "C:/Users/batuh/OneDrive/Documents/Workstation/BrandStockReturns/BrandData/unique_companies.csv"
 
-updated_file_path = find_stock_tickers(file_path)
-print(f'Updated file saved to: {updated_file_path}')
\ No newline at end of file
+if __name__ == "__main__":
+    file_path = "BrandData/unique_companies.csv"
+
+    updated_file_path = find_stock_tickers(file_path)
+    print(f'Updated file saved to: {updated_file_path}')
@@ -0,0 +1,190 @@
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then left out of the profile
+    resource = None
+
+DEFAULT_PROFILE_PATH = 'data/run_profile.json'
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10, 2)
+
+
+class Profiler:
+    """
+    Collects wall time, call counts, counters (network requests, bytes parsed, cache hits and
+    misses) and peak memory per named stage of a run.
+
+    Stages nest: wall time is inclusive and a counter is attributed to the innermost active
+    stage. Peak memory is always recorded as the process's peak RSS at the end of the stage.
+    With track_memory, tracemalloc also records the exact peak of Python allocations inside
+    each stage, at the cost of slowing the run down. With cprofile, the whole run is also
+    captured with cProfile for flamegraph tools such as snakeviz or flameprof.
+    """
+
+    def __init__(self, track_memory=False, cprofile=False):
+        self.track_memory = track_memory
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.stages = {}
+        self.totals = {}
+        self.stack = []
+        self.started_at = None
+        self.wall_seconds = None
+
+    def start(self):
+        self.started_at = datetime.now()
+        self._start_time = time.perf_counter()
+        if self.track_memory:
+            tracemalloc.start()
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+        if self.track_memory:
+            tracemalloc.stop()
+        self.wall_seconds = time.perf_counter() - self._start_time
+
+    def _record(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'wall_seconds': 0.0, 'calls': 0, 'counters': {}, 'max_rss_mb': None}
+            if self.track_memory:
+                self.stages[name]['peak_traced_mb'] = 0.0
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        frame = {'name': name, 'peak': 0}
+        if self.track_memory:
+            # Carry the enclosing stage's peak so far before resetting the peak for this stage
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            record = self._record(name)
+            record['wall_seconds'] += elapsed
+            record['calls'] += 1
+            record['max_rss_mb'] = max_rss_mb()
+            if self.track_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_traced_mb'] = max(record['peak_traced_mb'], round(peak / 2 ** 20, 2))
+                if self.stack:
+                    self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+                tracemalloc.reset_peak()
+
+    def count(self, counter, amount=1):
+        name = self.stack[-1]['name'] if self.stack else 'main'
+        counters = self._record(name)['counters']
+        counters[counter] = counters.get(counter, 0) + amount
+        self.totals[counter] = self.totals.get(counter, 0) + amount
+
+    def report(self):
+        stages = {}
+        for name, record in self.stages.items():
+            stages[name] = dict(record, wall_seconds=round(record['wall_seconds'], 6),
+                                counters=with_hit_ratios(record['counters']))
+        return {
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'wall_seconds': round(self.wall_seconds, 6) if self.wall_seconds is not None else None,
+            'max_rss_mb': max_rss_mb(),
+            'totals': with_hit_ratios(self.totals),
+            'stages': stages,
+        }
+
+    def write(self, path=DEFAULT_PROFILE_PATH):
+        """
+        Write the JSON profile to path and, with cprofile, the raw cProfile stats (.prof) and
+        a text summary of the slowest functions (.txt) next to it.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.cprofile:
+            base_path = os.path.splitext(path)[0]
+            self.cprofile.dump_stats(base_path + '.prof')
+            summary = io.StringIO()
+            pstats.Stats(self.cprofile, stream=summary).sort_stats('cumulative').print_stats(40)
+            with open(base_path + '.txt', 'w') as f:
+                f.write(summary.getvalue())
+        return path
+
+
+def with_hit_ratios(counters):
+    # Add <cache>_hit_ratio for every <cache>_hits / <cache>_misses pair
+    counters = dict(counters)
+    for key in list(counters):
+        if key.endswith('_hits'):
+            cache = key[:-len('_hits')]
+            total = counters[key] + counters.get(cache + '_misses', 0)
+            counters[cache + '_hit_ratio'] = round(counters[key] / total, 4) if total else None
+    for key in list(counters):
+        if key.endswith('_misses') and key[:-len('_misses')] + '_hit_ratio' not in counters:
+            counters[key[:-len('_misses')] + '_hit_ratio'] = 0.0
+    return counters
+
+
+_active = None
+
+
+def set_profiler(profiler):
+    global _active
+    _active = profiler
+
+
+def get_profiler():
+    return _active
+
+
+def stage(name):
+    # Without an active profiler, stages cost nothing
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def count(counter, amount=1):
+    if _active is not None:
+        _active.count(counter, amount)
+
+
+def instrumented(name=None):
+    """
+    Decorator that runs every call of the function as a stage, named after the function by default.
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _active.stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
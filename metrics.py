@@ -0,0 +1,170 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+PERIODS_PER_YEAR = {'1mo': 12, '1wk': 52, '1d': 252}
+# Rows of returns processed at a time; bounds memory to chunk_size x number of series
+DEFAULT_CHUNK_SIZE = 4096
+# Series processed at a time when a full column is needed, as for historical VaR
+DEFAULT_COLUMN_BLOCK = 64
+
+
+def iter_row_chunks(returns, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Works for in-memory arrays and np.memmap alike; only one chunk is materialized at a time
+    for start in range(0, len(returns), chunk_size):
+        yield start, np.asarray(returns[start:start + chunk_size], dtype=float)
+
+
+class StreamingMetrics:
+    """
+    Single-pass accumulator of return statistics for many series at once.
+
+    update is called with consecutive chunks of returns (periods x series, NaN for missing
+    periods) and optionally the benchmark returns of the same periods. Missing periods count
+    as a flat period for drawdowns and are left out of every other statistic.
+    """
+
+    def __init__(self, number_of_series, periods_per_year=12):
+        self.periods_per_year = periods_per_year
+        zeros = np.zeros(number_of_series)
+        self.count, self.total, self.total_squares, self.downside_squares = zeros.copy(), zeros.copy(), zeros.copy(), zeros.copy()
+        self.wealth, self.peak = np.ones(number_of_series), np.ones(number_of_series)
+        self.max_drawdown = zeros.copy()
+        self.underwater, self.max_drawdown_duration = zeros.copy(), zeros.copy()
+        self.joint_count, self.sum_r, self.sum_m, self.sum_rm, self.sum_mm = zeros.copy(), zeros.copy(), zeros.copy(), zeros.copy(), zeros.copy()
+
+    def update(self, chunk, benchmark=None):
+        valid = ~np.isnan(chunk)
+        r = np.where(valid, chunk, 0.0)
+        self.count += valid.sum(axis=0)
+        self.total += r.sum(axis=0)
+        self.total_squares += (r ** 2).sum(axis=0)
+        self.downside_squares += (np.minimum(r, 0.0) ** 2).sum(axis=0)
+
+        # Drawdowns, continuing the wealth path and running peak of the previous chunks
+        growth = np.cumprod(1 + r, axis=0) * self.wealth
+        peaks = np.maximum.accumulate(np.vstack([self.peak, growth]), axis=0)[1:]
+        self.max_drawdown = np.minimum(self.max_drawdown, (growth / peaks - 1).min(axis=0))
+
+        # Length of the current run of periods below the running peak, carried across chunks
+        below = growth < peaks
+        index = np.arange(len(chunk))[:, None]
+        last_recovery = np.maximum.accumulate(np.where(below, -1, index), axis=0)
+        run = np.where(last_recovery >= 0, index - last_recovery, index + 1 + self.underwater)
+        self.max_drawdown_duration = np.maximum(self.max_drawdown_duration, run.max(axis=0))
+        self.underwater = run[-1].astype(float)
+        self.wealth, self.peak = growth[-1], peaks[-1]
+
+        if benchmark is not None:
+            m = np.asarray(benchmark, dtype=float).reshape(-1, 1)
+            joint = valid & ~np.isnan(m)
+            rj, mj = np.where(joint, r, 0.0), np.where(joint, m, 0.0)
+            self.joint_count += joint.sum(axis=0)
+            self.sum_r += rj.sum(axis=0)
+            self.sum_m += mj.sum(axis=0)
+            self.sum_rm += (rj * mj).sum(axis=0)
+            self.sum_mm += (mj ** 2).sum(axis=0)
+
+    def result(self, alpha=0.05):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.total / self.count
+            std = np.sqrt((self.total_squares - self.total ** 2 / self.count) / (self.count - 1))
+            downside_deviation = np.sqrt(self.downside_squares / self.count)
+            annualization = self.periods_per_year ** 0.5
+            z = NormalDist().inv_cdf(alpha)
+            metrics = {
+                'periods': self.count,
+                'mean_return': mean,
+                'volatility': std * annualization,
+                # No risk-free rate, as in the original Sharpe ratio
+                'sharpe_ratio': mean / std * annualization,
+                'sortino_ratio': mean / downside_deviation * annualization,
+                'max_drawdown': self.max_drawdown,
+                'max_drawdown_duration': self.max_drawdown_duration,
+                'parametric_var': -(mean + z * std),
+                'parametric_cvar': -(mean - std * NormalDist().pdf(z) / alpha),
+            }
+            if self.joint_count.any():
+                covariance = self.sum_rm / self.joint_count - self.sum_r * self.sum_m / self.joint_count ** 2
+                variance = self.sum_mm / self.joint_count - (self.sum_m / self.joint_count) ** 2
+                metrics['beta'] = covariance / variance
+        return metrics
+
+
+def historical_var(returns, alpha=0.05, column_block=DEFAULT_COLUMN_BLOCK):
+    """
+    Historical VaR and CVaR (expected shortfall) per series, as positive per-period losses.
+    Series are processed a block of columns at a time to bound memory.
+    """
+    number_of_series = returns.shape[1]
+    var, cvar = np.full(number_of_series, np.nan), np.full(number_of_series, np.nan)
+    for start in range(0, number_of_series, column_block):
+        block = np.asarray(returns[:, start:start + column_block], dtype=float)
+        has_data = (~np.isnan(block)).any(axis=0)
+        if not has_data.any():
+            continue
+        quantile = np.full(block.shape[1], np.nan)
+        quantile[has_data] = np.nanquantile(block[:, has_data], alpha, axis=0)
+        tail = np.where(block <= quantile, block, np.nan)
+        with np.errstate(invalid='ignore'):
+            tail_mean = np.nansum(tail, axis=0) / (~np.isnan(tail)).sum(axis=0)
+        var[start:start + column_block] = -quantile
+        cvar[start:start + column_block] = -tail_mean
+    return var, cvar
+
+
+def rolling_metrics(returns, window, periods_per_year=12, benchmark=None, chunk_size=DEFAULT_CHUNK_SIZE, out_directory=None):
+    """
+    Rolling-window return, volatility, Sharpe ratio and (with a benchmark) beta for every series.
+
+    Chunks are extended with the last window - 1 rows of the previous chunk, so results are
+    identical to a single pass. With out_directory the outputs are memory-mapped .npy files
+    instead of in-memory arrays.
+    """
+    shape = returns.shape
+    names = ['rolling_return', 'rolling_volatility', 'rolling_sharpe_ratio'] + (['rolling_beta'] if benchmark is not None else [])
+    if out_directory:
+        outputs = {name: np.lib.format.open_memmap(f'{out_directory}/{name}.npy', mode='w+', dtype=float, shape=shape) for name in names}
+    else:
+        outputs = {name: np.empty(shape) for name in names}
+
+    annualization = periods_per_year ** 0.5
+    tail, benchmark_tail = np.empty((0, shape[1])), np.empty(0)
+    for start, chunk in iter_row_chunks(returns, chunk_size):
+        extended = pd.DataFrame(np.vstack([tail, chunk]))
+        rolling = extended.rolling(window, min_periods=window)
+        mean, std = rolling.mean(), rolling.std()
+        growth = np.log1p(extended).rolling(window, min_periods=window).sum()
+        offset = len(tail)
+        rows = slice(start, start + len(chunk))
+        outputs['rolling_return'][rows] = np.expm1(growth.to_numpy()[offset:])
+        outputs['rolling_volatility'][rows] = (std * annualization).to_numpy()[offset:]
+        outputs['rolling_sharpe_ratio'][rows] = (mean / std * annualization).to_numpy()[offset:]
+        if benchmark is not None:
+            extended_benchmark = pd.Series(np.concatenate([benchmark_tail, np.asarray(benchmark[rows], dtype=float)]))
+            covariance = extended.rolling(window, min_periods=window).cov(extended_benchmark)
+            variance = extended_benchmark.rolling(window, min_periods=window).var()
+            outputs['rolling_beta'][rows] = covariance.div(variance, axis=0).to_numpy()[offset:]
+            benchmark_tail = extended_benchmark.to_numpy()[-(window - 1):] if window > 1 else np.empty(0)
+        tail = extended.to_numpy()[-(window - 1):] if window > 1 else np.empty((0, shape[1]))
+    return outputs
+
+
+def compute_metrics(returns, periods_per_year=12, benchmark=None, alpha=0.05, rolling_window=None, chunk_size=DEFAULT_CHUNK_SIZE, out_directory=None):
+    """
+    Compute every risk metric for a (periods x series) array of returns, which may be a
+    np.memmap, in one streaming pass plus one blocked pass for historical VaR. Returns a dict of
+    per-series arrays, plus the rolling arrays when rolling_window is given (memory-mapped in
+    out_directory if given, see rolling_metrics).
+    """
+    returns = returns.reshape(-1, 1) if returns.ndim == 1 else returns
+    accumulator = StreamingMetrics(returns.shape[1], periods_per_year)
+    for start, chunk in iter_row_chunks(returns, chunk_size):
+        accumulator.update(chunk, None if benchmark is None else benchmark[start:start + len(chunk)])
+    metrics = accumulator.result(alpha)
+    metrics['historical_var'], metrics['historical_cvar'] = historical_var(returns, alpha)
+    if rolling_window:
+        metrics.update(rolling_metrics(returns, rolling_window, periods_per_year, benchmark, chunk_size, out_directory))
+    return metrics
+
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from instrumentation import count
+from price_providers import YahooPriceProvider
+
+DEFAULT_CACHE_PATH = 'data/price_cache.sqlite'
+# Ranges fetched before they were complete (e.g. the current year) are refreshed after this many days
+DEFAULT_MAX_AGE_DAYS = 1
+# Ranges that were complete but came back without any bars (e.g. a delisted ticker) are retried after this many days
+DEFAULT_EMPTY_MAX_AGE_DAYS = 30
+# Tickers per query, well below SQLite's limit on the number of bound parameters
+TICKER_CHUNK_SIZE = 500
+# Set to 1 to run every price cache offline unless a caller asks otherwise
+OFFLINE_ENVIRONMENT_VARIABLE = 'BRANDSTOCK_OFFLINE'
+# SQL condition on a coverage row: whether any price was stored in its range
+HAS_BARS = ("EXISTS (SELECT 1 FROM prices WHERE prices.ticker = coverage.ticker AND prices.interval = coverage.interval "
+            "AND prices.date >= coverage.start AND prices.date < coverage.end)")
+
+
+def offline_from_environment():
+    return os.environ.get(OFFLINE_ENVIRONMENT_VARIABLE) == '1'
+
+
+def open_period_start(interval, today=None):
+    """
+    First date of the bar that is still open today: the current month, week or day. Bars
+    before it are final.
+    """
+    today = today or datetime.now().date()
+    if interval == '1mo':
+        today = today.replace(day=1)
+    elif interval == '1wk':
+        today -= timedelta(days=today.weekday())
+    return today.isoformat()
+
+
+class PriceCache:
+    """
+    On-disk store of adjusted close prices keyed by ticker, interval and date.
+
+    Only the date ranges that have never been fetched are downloaded. A fetched range is split
+    at the start of the bar that is still open, so its final bars are kept for good and only
+    the open tail (e.g. the current month) is evicted once it is older than max_age_days.
+    Complete ranges fetched without any bars are evicted after empty_max_age_days: providers
+    return empty results on rate limits and network errors, so an empty range (e.g. for a
+    delisted ticker) is only trusted for a while. In offline mode the provider is never called,
+    nothing is evicted and only cached prices are returned. offline=None follows the
+    BRANDSTOCK_OFFLINE environment variable.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, offline=None, max_age_days=DEFAULT_MAX_AGE_DAYS, provider=None,
+                 empty_max_age_days=DEFAULT_EMPTY_MAX_AGE_DAYS):
+        self.path = path
+        self.offline = offline_from_environment() if offline is None else offline
+        self.provider = provider if provider is not None else YahooPriceProvider()
+        self.max_age_days = max_age_days
+        self.empty_max_age_days = empty_max_age_days
+        self.network_requests = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS prices (
+                ticker TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                date TEXT NOT NULL,
+                adj_close REAL,
+                PRIMARY KEY (ticker, interval, date)
+            );
+            CREATE TABLE IF NOT EXISTS coverage (
+                ticker TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                fetched_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS coverage_ticker ON coverage (ticker, interval);
+        """)
+        self.evict_stale()
+
+    def close(self):
+        self.conn.close()
+
+    def evict_stale(self):
+        # Evicted prices could not be fetched again, so an offline cache keeps everything it has
+        if self.offline:
+            return 0
+        # A range is stale if it was still open when fetched and that fetch is older than max_age_days
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        empty_cutoff = (datetime.now() - timedelta(days=self.empty_max_age_days)).isoformat()
+        with self.conn:
+            stale = self.conn.execute(
+                "SELECT ticker, interval, start, end FROM coverage WHERE fetched_at < end AND fetched_at < ?",
+                (cutoff,)).fetchall()
+            # Ranges fetched without any bars may have been a failed request rather than a ticker without prices
+            stale += self.conn.execute(
+                f"SELECT ticker, interval, start, end FROM coverage WHERE fetched_at >= end AND fetched_at < ? AND NOT {HAS_BARS}",
+                (empty_cutoff,)).fetchall()
+            for ticker, interval, start, end in stale:
+                self.conn.execute(
+                    "DELETE FROM prices WHERE ticker = ? AND interval = ? AND date >= ? AND date < ?",
+                    (ticker, interval, start, end))
+                self.conn.execute(
+                    "DELETE FROM coverage WHERE ticker = ? AND interval = ? AND start = ? AND end = ?",
+                    (ticker, interval, start, end))
+        return len(stale)
+
+    def missing_ranges(self, ticker, start, end, interval='1mo'):
+        """
+        Return the list of (start, end) date ranges inside [start, end) that are not cached.
+        """
+        covered = self.conn.execute(
+            "SELECT start, end FROM coverage WHERE ticker = ? AND interval = ? AND end > ? AND start < ? ORDER BY start",
+            (ticker, interval, start, end)).fetchall()
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in covered:
+            if covered_start > cursor:
+                gaps.append((cursor, min(covered_start, end)))
+            cursor = max(cursor, covered_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def version(self, tickers, start, end, interval='1mo'):
+        """
+        Return a version string for the cached prices of tickers in [start, end): the time of the
+        latest fetch overlapping that window. It changes whenever those prices are fetched again,
+        except for ranges fetched without any bars, which add no prices.
+        """
+        versions = [rows[0][0] for rows in self._query_tickers(
+            f"SELECT MAX(fetched_at) || ':' || COUNT(*) FROM coverage WHERE interval = ? AND end > ? AND start < ? "
+            f"AND ticker IN ({{placeholders}}) AND {HAS_BARS}",
+            (interval, start, end), tickers)]
+        return ','.join(str(v) for v in versions)
+
+    def prefetch(self, tickers, start, end, interval='1mo'):
+        """
+        Make sure every ticker is cached for [start, end). Tickers missing the same date range
+        are fetched together, so a cold run costs one provider request per distinct gap.
+        """
+        tickers_by_gap = {}
+        for ticker in dict.fromkeys(tickers):
+            gaps = self.missing_ranges(ticker, start, end, interval)
+            count('price_cache_misses' if gaps else 'price_cache_hits')
+            for gap in gaps:
+                tickers_by_gap.setdefault(gap, []).append(ticker)
+        if not tickers_by_gap:
+            return
+        if self.offline:
+            print(f'Offline: {sum(len(t) for t in tickers_by_gap.values())} ticker ranges are not cached, using cached prices only')
+            return
+        for (gap_start, gap_end), gap_tickers in tickers_by_gap.items():
+            self._fetch(gap_tickers, gap_start, gap_end, interval)
+
+    def get_prices(self, ticker, start, end, interval='1mo'):
+        """
+        Return the adjusted close prices of a ticker in [start, end) as a Series indexed by date,
+        downloading any missing ranges unless the cache is offline.
+        """
+        gaps = self.missing_ranges(ticker, start, end, interval)
+        count('price_cache_misses' if gaps else 'price_cache_hits')
+        if gaps and self.offline:
+            print(f'Offline: {ticker} is not cached for {gaps}, using cached prices only')
+        elif gaps:
+            for gap_start, gap_end in gaps:
+                self._fetch([ticker], gap_start, gap_end, interval)
+
+        rows = self.conn.execute(
+            "SELECT date, adj_close FROM prices WHERE ticker = ? AND interval = ? AND date >= ? AND date < ? ORDER BY date",
+            (ticker, interval, start, end)).fetchall()
+        if not rows:
+            return pd.Series(dtype=float, name=ticker)
+        dates, values = zip(*rows)
+        return pd.Series(values, index=pd.to_datetime(list(dates)), name=ticker, dtype=float)
+
+    def get_price_frame(self, tickers, start, end, interval='1mo'):
+        """
+        Return cached adjusted close prices in [start, end) as a DataFrame indexed by date with
+        one column per ticker. Call prefetch first to fill in missing ranges.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        rows = [row for chunk_rows in self._query_tickers(
+            "SELECT date, ticker, adj_close FROM prices WHERE interval = ? AND date >= ? AND date < ? AND ticker IN ({placeholders})",
+            (interval, start, end), tickers) for row in chunk_rows]
+        frame = pd.DataFrame(rows, columns=['date', 'ticker', 'adj_close'])
+        frame['date'] = pd.to_datetime(frame['date'])
+        prices = frame.pivot(index='date', columns='ticker', values='adj_close')
+        return prices.reindex(columns=tickers).sort_index().astype(float)
+
+    def _query_tickers(self, query, parameters, tickers):
+        # Runs query once per chunk of tickers, with {placeholders} replaced by one ? per ticker, and yields the rows of each chunk
+        tickers = list(dict.fromkeys(tickers))
+        for i in range(0, len(tickers), TICKER_CHUNK_SIZE):
+            chunk = tickers[i:i + TICKER_CHUNK_SIZE]
+            yield self.conn.execute(query.format(placeholders=','.join('?' * len(chunk))), (*parameters, *chunk)).fetchall()
+
+    def _fetch(self, tickers, start, end, interval):
+        self.network_requests += 1
+        count('network_requests')
+        data = self.provider.fetch(tickers, start, end, interval)
+        # Providers return parsed frames rather than responses, so this is the size of the parsed prices, not of the transfer
+        count('bytes_parsed', int(data.memory_usage(deep=True).sum()))
+
+        rows = []
+        for ticker in tickers:
+            adj_close = data[ticker].dropna() if ticker in data else pd.Series(dtype=float)
+            for date, value in adj_close.items():
+                date = pd.Timestamp(date).strftime('%Y-%m-%d')
+                # Providers can return the bar of the month containing start, which belongs to an earlier range
+                if start <= date < end:
+                    rows.append((ticker, interval, date, float(value)))
+
+        fetched_at = datetime.now().isoformat()
+        # The bars before the open one are final, so they get their own complete range and only the open tail expires
+        split = open_period_start(interval)
+        ranges = [(start, split), (split, end)] if start < split < end else [(start, end)]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO prices (ticker, interval, date, adj_close) VALUES (?, ?, ?, ?)", rows)
+            # Empty results are recorded too, so delisted tickers are not downloaded again until evict_stale drops them
+            self.conn.executemany(
+                "INSERT INTO coverage (ticker, interval, start, end, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                [(ticker, interval, range_start, range_end, fetched_at) for ticker in tickers for range_start, range_end in ranges])
+
+
+_default_cache = None
+
+
+def get_price_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PriceCache()
+    return _default_cache
+
+
+def set_price_cache(cache):
+    global _default_cache
+    _default_cache = cache
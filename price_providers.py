@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+
+
+class PriceProvider:
+    """
+    Source of adjusted close prices. fetch returns a DataFrame indexed by date with one
+    column per ticker for the bars in [start, end).
+    """
+
+    def fetch(self, tickers, start, end, interval='1mo'):
+        raise NotImplementedError
+
+
+class YahooPriceProvider(PriceProvider):
+    """
+    Downloads all tickers of a date window from Yahoo Finance in a single yf.download call.
+    """
+
+    def fetch(self, tickers, start, end, interval='1mo'):
+        import yfinance as yf
+
+        tickers = list(tickers)
+        data = yf.download(tickers, start=start, end=end, interval=interval, auto_adjust=False, progress=False)
+        if data is None or len(data) == 0:
+            return pd.DataFrame(columns=tickers, dtype=float)
+        adj_close = data['Adj Close']
+        # Older yfinance versions return a Series when a single ticker is requested
+        if isinstance(adj_close, pd.Series):
+            adj_close = adj_close.to_frame(tickers[0])
+        return adj_close.reindex(columns=tickers)
+
+
+class FilePriceProvider(PriceProvider):
+    """
+    Reads prices from local CSV files named {ticker}_{interval}.csv with 'Date' and
+    'Adj Close' columns. Used for tests and offline runs without a populated cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, ticker, interval):
+        # Index tickers such as ^GSPC are stored without the caret
+        return os.path.join(self.directory, f"{ticker.replace('^', '')}_{interval}.csv")
+
+    def fetch(self, tickers, start, end, interval='1mo'):
+        columns = {}
+        for ticker in tickers:
+            path = self.path_for(ticker, interval)
+            if not os.path.exists(path):
+                columns[ticker] = pd.Series(dtype=float)
+                continue
+            prices = pd.read_csv(path, parse_dates=['Date']).set_index('Date')['Adj Close']
+            columns[ticker] = prices[(prices.index >= start) & (prices.index < end)]
+        return pd.DataFrame(columns, columns=list(tickers))
+
+    def write(self, ticker, prices, interval='1mo'):
+        """
+        Save a Series of adjusted close prices indexed by date for ticker.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        frame = pd.DataFrame({'Date': pd.to_datetime(prices.index), 'Adj Close': prices.values})
+        frame.to_csv(self.path_for(ticker, interval), index=False)
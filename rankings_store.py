@@ -0,0 +1,163 @@
+import glob
+import hashlib
+import os
+import pickle
+import re
+
+import pandas as pd
+
+from instrumentation import count
+
+RANKINGS_FILE_PATTERN = 'brandirectory-ranking-data-global-*.csv'
+CACHE_FILE_NAME = 'rankings_cache.pkl'
+# Brands that were not ranked the previous year are treated as if they came from just outside the top 500
+UNRANKED_PREVIOUS_POSITION = 501
+
+SELECTION_METHODS = ('top', 'most_improved_exact', 'most_improved_weighted')
+
+COLUMNS = {
+    'Brand': 'brand',
+    'Position': 'position',
+    'Previous Position': 'previous_position',
+    'Brand Value ($M)': 'value',
+    'Previous Brand Value ($M)': 'previous_value',
+    'Rating': 'rating',
+    'Previous Rating': 'previous_rating',
+}
+
+
+def selection_method(most_improved=False, weighted=False):
+    if not most_improved:
+        return 'top'
+    return 'most_improved_weighted' if weighted else 'most_improved_exact'
+
+
+def rank_brands(year_rankings, method):
+    """
+    Order the brands of one year's rankings (in file order) by a selection method, best first.
+    """
+    if method == 'top':
+        return year_rankings['brand'].tolist()
+    previous_position = year_rankings['previous_position'].fillna(UNRANKED_PREVIOUS_POSITION)
+    position_change = previous_position - year_rankings['position']
+    if method == 'most_improved_weighted':
+        # The smaller the previous position, the larger the weight for the same position change
+        score = position_change / previous_position
+    elif method == 'most_improved_exact':
+        score = position_change
+    else:
+        raise ValueError(f'Unknown selection method: {method}')
+    return year_rankings['brand'][score.sort_values(ascending=False).index].tolist()
+
+
+class RankingsStore:
+    """
+    All brandirectory rankings parsed once into one long table with a row per brand and year.
+
+    The parsed table and the brand order of every selection method are cached in
+    rankings_cache.pkl next to the CSVs, and rebuilt when any CSV is added, removed or
+    modified.
+    """
+
+    def __init__(self, rankings_directory, cache_path=None):
+        self.rankings_directory = rankings_directory
+        self.cache_path = cache_path or os.path.join(rankings_directory, CACHE_FILE_NAME)
+        self.signature = self._signature()
+        cached = self._read_cache(self.signature)
+        count('rankings_cache_misses' if cached is None else 'rankings_cache_hits')
+        if cached is None:
+            self.table = self._parse_all()
+            self.selections = self._precompute_selections()
+            self.file_hashes = self._hash_files()
+            self._write_cache(self.signature)
+        else:
+            self.table, self.selections, self.file_hashes = cached
+        self.years = sorted(self.table['year'].unique().tolist())
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.rankings_directory, RANKINGS_FILE_PATTERN)))
+
+    def _signature(self):
+        return [(os.path.basename(path), os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in self._files()]
+
+    def _read_cache(self, signature):
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            print(f'Ignoring unreadable rankings cache {self.cache_path}: {e}')
+            return None
+        if cached.get('signature') != signature or 'file_hashes' not in cached:
+            return None
+        return cached['table'], cached['selections'], cached['file_hashes']
+
+    def _write_cache(self, signature):
+        with open(self.cache_path, 'wb') as f:
+            pickle.dump({'signature': signature, 'table': self.table, 'selections': self.selections, 'file_hashes': self.file_hashes},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _hash_files(self):
+        # Content hash of each year's CSV, used to fingerprint results computed from it
+        file_hashes = {}
+        for path in self._files():
+            year = int(re.search(r'(\d{4})\.csv$', path).group(1))
+            with open(path, 'rb') as f:
+                file_hashes[year] = hashlib.sha1(f.read()).hexdigest()
+        return file_hashes
+
+    def _parse_all(self):
+        frames = []
+        for path in self._files():
+            year = int(re.search(r'(\d{4})\.csv$', path).group(1))
+            rankings = pd.read_csv(path).rename(columns=COLUMNS)[list(COLUMNS.values())]
+            # Older files use "-" placeholders for missing previous values
+            for column in ['position', 'previous_position', 'value', 'previous_value']:
+                rankings[column] = pd.to_numeric(rankings[column], errors='coerce')
+            for column in ['rating', 'previous_rating']:
+                rankings[column] = rankings[column].where(rankings[column] != '-')
+            rankings.insert(1, 'year', year)
+            frames.append(rankings)
+        table = pd.concat(frames, ignore_index=True)
+        table['brand'] = table['brand'].astype(str)
+        table['year'] = table['year'].astype('int16')
+        table['position'] = table['position'].astype('Int16')
+        table['previous_position'] = table['previous_position'].astype('float32')
+        table['rating'] = table['rating'].astype('category')
+        table['previous_rating'] = table['previous_rating'].astype('category')
+        return table
+
+    def _precompute_selections(self):
+        selections = {}
+        for year, year_rankings in self.table.groupby('year', sort=True):
+            year_rankings = year_rankings.reset_index(drop=True)
+            year_rankings = year_rankings.assign(
+                position=year_rankings['position'].astype(float),
+                previous_position=year_rankings['previous_position'].astype(float))
+            for method in SELECTION_METHODS:
+                selections[(int(year), method)] = rank_brands(year_rankings, method)
+        return selections
+
+    def year(self, year):
+        return self.table[self.table['year'] == year]
+
+    def select(self, year, method='top', number_of_brands=10):
+        """
+        Return the best number_of_brands brands of a year under a selection method.
+        """
+        key = (year, method)
+        if key not in self.selections:
+            raise KeyError(f'No {method} rankings for {year} in {self.rankings_directory}')
+        return self.selections[key][:number_of_brands]
+
+
+_stores = {}
+
+
+def get_rankings_store(rankings_directory):
+    store = _stores.get(rankings_directory)
+    # Reload if the CSVs changed since the store was built, e.g. when a new year was added
+    if store is None or store.signature != store._signature():
+        store = _stores[rankings_directory] = RankingsStore(rankings_directory)
+    return store
@@ -0,0 +1,289 @@
+import csv
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from instrumentation import count, instrumented, stage
+from result_store import fingerprint
+
+# Bump when the layout of any output changes, so every output is rendered again once
+RENDER_VERSION = 2
+REPORT_FORMATS = ('pdf', 'html', 'csv')
+MANIFEST_NAME = 'report_manifest.json'
+
+
+@instrumented()
+def create_pdf(pdf_path, table_data, stock_details_by_strategy, image_directory='data'):
+    # stock_details_by_strategy maps each strategy's label to its {year: [(ticker, yearly return)]}
+    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Add cumulative and yearly returns images
+    story.append(Paragraph('<b>Cumulative Returns</b>', styles['Heading2']))
+    story.append(Image(f'{image_directory}/cumulative_returns.png', 6*inch, 3*inch))  # Adjust dimensions as needed
+    story.append(Spacer(1, 12))
+
+    story.append(Paragraph('<b>Yearly Returns</b>', styles['Heading2']))
+    story.append(Image(f'{image_directory}/yearly_returns.png', 6*inch, 3*inch))  # Adjust dimensions as needed
+    story.append(Spacer(1, 12))
+
+    # Add net returns and Sharpe Ratios table
+    story.append(Paragraph('<b>Net Returns and Sharpe Ratios</b>', styles['Heading2']))
+    # The label column keeps its width; the value columns share the rest of the page
+    value_columns = len(table_data[0]) - 1
+    summary_rows = [[f'{value:.4f}' if isinstance(value, float) else value for value in row] for row in table_data]
+    table = Table(summary_rows, colWidths=[2.5*inch] + [min(2.5*inch, 4*inch / value_columns)] * value_columns)
+    story.append(table)
+    story.append(Spacer(1, 12))
+
+    # Holdings are listed as one compact table per strategy, one row per year
+    holdings_style = styles['Normal'].clone('Holdings', fontSize=7, leading=8.5)
+    table_style = TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ])
+
+    def add_stock_details_to_story(strategy_name, stock_details):
+        story.append(Paragraph(f'<b>{strategy_name} Strategy</b>', styles['Heading2']))
+        rows = [['Year', 'Holdings (yearly return)']]
+        for year, stocks in stock_details.items():
+            rows.append([str(year), Paragraph(', '.join(f'{ticker} {return_val:.2%}' for ticker, return_val in stocks), holdings_style)])
+        story.append(Table(rows, colWidths=[0.6*inch, 6.4*inch], style=table_style, repeatRows=1))
+        story.append(Spacer(1, 12))
+
+    # Add stock details for each strategy
+    for strategy_name, stock_details in stock_details_by_strategy.items():
+        add_stock_details_to_story(strategy_name, stock_details)
+
+    doc.build(story)
+
+
+@instrumented()
+def plot_cumulative_returns(yearly_returns_by_strategy, start_year, end_year, output_path='data/cumulative_returns.png'):
+    # yearly_returns_by_strategy maps each strategy's label to its list of yearly returns
+    # Draw on a standalone figure rather than global pyplot state, so charts can be rendered in parallel processes
+    figure = Figure()
+    ax = figure.subplots()
+    # Plot the cumulative returns over time from yearly returns.
+    for label, total_yearly_returns in yearly_returns_by_strategy.items():
+        cumulative_returns = [1]
+        for yearly_return in total_yearly_returns:
+            cumulative_returns.append(cumulative_returns[-1] * (1 + yearly_return))
+        print(f'Cumulative Returns for {label}: {cumulative_returns}')
+        ax.plot(cumulative_returns, label=label)
+
+    # Add labels and legend
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Cumulative Returns')
+
+    # Add xticks starting from start_year-1(2020) to end_year+1(2022)
+    ax.set_xticks(range(end_year - start_year + 2), [str(year) for year in range(start_year-1, end_year+1)])
+    
+    ax.legend()
+    figure.savefig(output_path, format='png')
+
+@instrumented()
+def plot_yearly_returns(yearly_returns_by_strategy, start_year, end_year, output_path='data/yearly_returns.png'):
+    figure = Figure()
+    ax = figure.subplots()
+
+    # Number of groups (years)
+    num_groups = end_year - start_year + 1
+
+    # Positions for the bars on the x-axis, sharing 0.8 of each group between the strategies
+    bar_width = 0.8 / max(1, len(yearly_returns_by_strategy))
+    index = np.arange(num_groups)
+
+    # Plot each strategy
+    for i, (label, total_yearly_returns) in enumerate(yearly_returns_by_strategy.items()):
+        ax.bar(index + i * bar_width, total_yearly_returns, bar_width, label=label)
+
+    # Add labels and legend
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Yearly Returns')
+    ax.set_title('Yearly Returns by Strategy')
+    ax.set_xticks(index + bar_width * (len(yearly_returns_by_strategy) - 1) / 2, [str(year) for year in range(start_year, end_year + 1)])
+    ax.legend()
+
+    # Save the figure
+    figure.savefig(output_path, format='png')
+
+
+class RenderManifest:
+    """
+    Input hash of every output rendered into a directory, kept in report_manifest.json.
+
+    An output is current while the file exists and the hash of the data it was rendered from
+    is unchanged, in which case rendering it again is skipped.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        try:
+            with open(self.path) as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = {}
+
+    def is_current(self, output_path, input_hash):
+        current = self.hashes.get(os.path.basename(output_path)) == input_hash and os.path.exists(output_path)
+        count('report_outputs_skipped' if current else 'report_outputs_rendered')
+        return current
+
+    def record(self, output_path, input_hash):
+        self.hashes[os.path.basename(output_path)] = input_hash
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run never leaves a truncated manifest
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(self.hashes, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+
+def _render_chart(plot, yearly_returns_by_strategy, start_year, end_year, output_path):
+    # Runs in a worker process with parallel; the charts are drawn on standalone figures with the Agg renderer
+    plot(yearly_returns_by_strategy, start_year, end_year, output_path=output_path)
+    return output_path
+
+
+@instrumented()
+def render_charts(yearly_returns_by_strategy, start_year, end_year, directory='data', manifest=None, parallel=False):
+    """
+    Draw the cumulative and yearly returns charts into directory, skipping charts whose input is
+    unchanged. With parallel, the charts that need drawing are drawn in separate processes; a
+    process pool costs about as much to start as drawing the two charts, so it is off by default.
+    Returns a dict mapping each chart path to its input hash.
+    """
+    manifest = manifest or RenderManifest(directory)
+    charts = {
+        os.path.join(directory, 'cumulative_returns.png'): plot_cumulative_returns,
+        os.path.join(directory, 'yearly_returns.png'): plot_yearly_returns,
+    }
+    hashes = {path: fingerprint(RENDER_VERSION, plot.__name__, yearly_returns_by_strategy, start_year, end_year) for path, plot in charts.items()}
+    stale = [path for path in charts if not manifest.is_current(path, hashes[path])]
+
+    if parallel and len(stale) > 1:
+        with ProcessPoolExecutor(max_workers=len(stale)) as executor:
+            futures = [executor.submit(_render_chart, charts[path], yearly_returns_by_strategy, start_year, end_year, path) for path in stale]
+            for path, future in zip(stale, futures):
+                # The profiler is not active in the workers, so each chart is recorded here as the wait for its result
+                with stage(charts[path].__name__):
+                    future.result()
+                manifest.record(path, hashes[path])
+    else:
+        for path in stale:
+            _render_chart(charts[path], yearly_returns_by_strategy, start_year, end_year, path)
+            manifest.record(path, hashes[path])
+    return hashes
+
+
+@instrumented()
+def write_csv_report(table_data, yearly_returns_by_strategy, stock_details_by_strategy, start_year, end_year, directory='data', manifest=None):
+    """
+    Write the summary table, the yearly returns and the holdings as CSV files, skipping files
+    whose input is unchanged. Returns the paths of the files.
+    """
+    manifest = manifest or RenderManifest(directory)
+    years = range(start_year, end_year + 1)
+    sections = {
+        'summary.csv': (table_data[0], table_data[1:]),
+        'yearly_returns.csv': (['Year'] + list(yearly_returns_by_strategy),
+                               [[year] + [returns[i] for returns in yearly_returns_by_strategy.values()] for i, year in enumerate(years)]),
+        'holdings.csv': (['Strategy', 'Year', 'Ticker', 'Yearly Return'],
+                         [[label, year, ticker, return_val] for label, stock_details in stock_details_by_strategy.items()
+                          for year, stocks in stock_details.items() for ticker, return_val in stocks]),
+    }
+    paths = []
+    for name, (header, rows) in sections.items():
+        path = os.path.join(directory, name)
+        input_hash = fingerprint(RENDER_VERSION, header, rows)
+        if not manifest.is_current(path, input_hash):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+            manifest.record(path, input_hash)
+        paths.append(path)
+    return paths
+
+
+def _html_table(rows, header=True):
+    cells = ['<tr>' + ''.join(f'<{"th" if header and i == 0 else "td"}>{html.escape(str(value))}</{"th" if header and i == 0 else "td"}>' for value in row) + '</tr>'
+             for i, row in enumerate(rows)]
+    return '<table>\n' + '\n'.join(cells) + '\n</table>'
+
+
+@instrumented()
+def write_html_report(html_path, table_data, stock_details_by_strategy, image_directory='data'):
+    # A single page with the same content as the PDF; the charts are linked rather than embedded
+    image_prefix = os.path.relpath(image_directory, os.path.dirname(html_path) or '.')
+    body = [
+        '<h2>Cumulative Returns</h2>',
+        f'<img src="{html.escape(image_prefix)}/cumulative_returns.png" alt="Cumulative Returns">',
+        '<h2>Yearly Returns</h2>',
+        f'<img src="{html.escape(image_prefix)}/yearly_returns.png" alt="Yearly Returns">',
+        '<h2>Net Returns and Sharpe Ratios</h2>',
+        _html_table(table_data),
+    ]
+    for strategy_name, stock_details in stock_details_by_strategy.items():
+        body.append(f'<h2>{html.escape(strategy_name)} Strategy</h2>')
+        rows = [['Year', 'Holdings (yearly return)']]
+        rows += [[year, ', '.join(f'{ticker} {return_val:.2%}' for ticker, return_val in stocks)] for year, stocks in stock_details.items()]
+        body.append(_html_table(rows))
+    with open(html_path, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>Brand Stock Analysis Report</title>\n'
+                '<style>table { border-collapse: collapse; font-size: small; } th, td { border: 1px solid #999; padding: 2px 6px; text-align: left; }</style>\n'
+                '</head>\n<body>\n' + '\n'.join(body) + '\n</body>\n</html>\n')
+
+
+@instrumented()
+def render_report(table_data, yearly_returns_by_strategy, stock_details_by_strategy, start_year, end_year, directory='data', formats=('pdf',), parallel=False):
+    """
+    Render the report in each of formats ('pdf', 'html' and 'csv') into directory.
+
+    Every chart and output records the hash of the data it was rendered from, and is only
+    rendered again when that data changes. Returns the paths of the outputs.
+    """
+    unknown = set(formats) - set(REPORT_FORMATS)
+    if unknown:
+        raise ValueError(f'Unknown report formats: {sorted(unknown)}')
+    os.makedirs(directory, exist_ok=True)
+    manifest = RenderManifest(directory)
+    paths = []
+
+    chart_hashes = {}
+    if 'pdf' in formats or 'html' in formats:
+        chart_hashes = render_charts(yearly_returns_by_strategy, start_year, end_year, directory, manifest, parallel)
+
+    # The PDF embeds the charts, so it is also rendered again when either chart changes
+    document_hash = fingerprint(RENDER_VERSION, table_data, stock_details_by_strategy, sorted(chart_hashes.values()))
+    if 'pdf' in formats:
+        pdf_path = os.path.join(directory, 'analysis_report.pdf')
+        if not manifest.is_current(pdf_path, document_hash):
+            create_pdf(pdf_path, table_data, stock_details_by_strategy, image_directory=directory)
+            manifest.record(pdf_path, document_hash)
+        paths.append(pdf_path)
+    if 'html' in formats:
+        html_path = os.path.join(directory, 'analysis_report.html')
+        if not manifest.is_current(html_path, document_hash):
+            write_html_report(html_path, table_data, stock_details_by_strategy, image_directory=directory)
+            manifest.record(html_path, document_hash)
+        paths.append(html_path)
+    if 'csv' in formats:
+        paths.extend(write_csv_report(table_data, yearly_returns_by_strategy, stock_details_by_strategy, start_year, end_year, directory, manifest))
+
+    manifest.save()
+    return paths
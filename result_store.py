@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count
+
+DEFAULT_RESULT_STORE_PATH = 'data/results.sqlite'
+# Part of every fingerprint, so rows stored in an earlier format (monthly returns without dates) are computed again
+RESULT_VERSION = 2
+# Fingerprint of years computed without all of their prices (offline). It never matches, so they are computed again on
+# the next run, but their rows replace any older result and rolled_metrics covers the same results as the run
+UNFINISHED_FINGERPRINT = 'unfinished'
+
+
+def metrics_from_sums(log_growth, year_count, months, monthly_sum, monthly_sum_squares, periods_per_year=12):
+    """
+    Net return, annualized return and Sharpe ratio of a run of years, from the sums of their
+    yearly log growth and of their monthly returns and squared monthly returns.
+    """
+    if year_count == 0:
+        return {'net_return': 0, 'annualized_return': 0, 'sharpe_ratio': np.nan}
+    sharpe_ratio = np.nan
+    if months > 1:
+        variance = (monthly_sum_squares - monthly_sum ** 2 / months) / (months - 1)
+        if variance > 0:
+            # Same annualization as calculate_performance_metrics
+            sharpe_ratio = (monthly_sum / months) / np.sqrt(variance) * (periods_per_year ** 0.5)
+    return {
+        'net_return': float(np.expm1(log_growth)),
+        'annualized_return': float(np.exp(log_growth / year_count) - 1),
+        'sharpe_ratio': float(sharpe_ratio),
+    }
+
+
+def config_key(**config):
+    return json.dumps(config, sort_keys=True)
+
+
+def fingerprint(*inputs):
+    return hashlib.sha1(json.dumps((RESULT_VERSION, inputs), sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultStore:
+    """
+    Per-year strategy results keyed by strategy configuration and year.
+
+    Each row records a fingerprint of its inputs (the year's rankings file, the selected tickers
+    and the price cache version of the year's window). A stored year is reused only while its
+    fingerprint matches, so a run recomputes just the years whose inputs are new or changed.
+    Years computed without all of their prices are stored under UNFINISHED_FINGERPRINT.
+    Rows also keep the sums needed to roll net return, annualized return and Sharpe ratio
+    forward over any run of years without reloading monthly returns.
+    """
+
+    def __init__(self, path=DEFAULT_RESULT_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS year_results (
+                config TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                yearly_return REAL,
+                monthly_returns TEXT NOT NULL,
+                stock_details TEXT NOT NULL,
+                log_growth REAL,
+                months INTEGER NOT NULL,
+                monthly_sum REAL NOT NULL,
+                monthly_sum_squares REAL NOT NULL,
+                PRIMARY KEY (config, year)
+            )
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, config, year, year_fingerprint):
+        """
+        Return the stored (monthly_returns, yearly_return, stock_details) of a year if its
+        fingerprint matches, else None. monthly_returns is a Series indexed by date and
+        yearly_return is None for years without data.
+        """
+        row = self.conn.execute(
+            "SELECT yearly_return, monthly_returns, stock_details FROM year_results WHERE config = ? AND year = ? AND fingerprint = ?",
+            (config, year, year_fingerprint)).fetchone()
+        if row is None:
+            count('result_cache_misses')
+            return None
+        count('result_cache_hits')
+        yearly_return, monthly_returns, stock_details = row
+        monthly_returns = json.loads(monthly_returns)
+        monthly_returns = pd.Series(list(monthly_returns.values()), index=pd.DatetimeIndex(list(monthly_returns), name='date'), dtype=float)
+        return monthly_returns, yearly_return, [tuple(detail) for detail in json.loads(stock_details)]
+
+    def put(self, config, year, year_fingerprint, monthly_returns=None, yearly_return=None, stock_details=()):
+        # monthly_returns is a Series indexed by date, as returned by ReturnsPanel.portfolio_returns
+        monthly_returns = pd.Series(dtype=float) if monthly_returns is None else monthly_returns
+        monthly = monthly_returns.to_numpy(dtype=float)
+        dated = {date.strftime('%Y-%m-%d'): value for date, value in zip(monthly_returns.index, monthly.tolist())}
+        log_growth = float(np.log1p(yearly_return)) if yearly_return is not None else None
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO year_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (config, year, year_fingerprint, yearly_return, json.dumps(dated), json.dumps(list(stock_details)),
+                 log_growth, len(monthly), float(monthly.sum()), float((monthly ** 2).sum())))
+
+    def rolled_metrics(self, config, start_year, end_year, periods_per_year=12):
+        """
+        Net return, annualized return and Sharpe ratio over the stored years with data in
+        [start_year, end_year], computed from the per-year sums.
+        """
+        log_growth, year_count, months, monthly_sum, monthly_sum_squares = self.conn.execute(
+            "SELECT COALESCE(SUM(log_growth), 0), COUNT(yearly_return), COALESCE(SUM(months), 0), "
+            "COALESCE(SUM(monthly_sum), 0), COALESCE(SUM(monthly_sum_squares), 0) "
+            "FROM year_results WHERE config = ? AND year BETWEEN ? AND ? AND yearly_return IS NOT NULL",
+            (config, start_year, end_year)).fetchone()
+        return metrics_from_sums(log_growth, year_count, months, monthly_sum, monthly_sum_squares, periods_per_year)
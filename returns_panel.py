@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from metrics import PERIODS_PER_YEAR
+
+# A ticker needs bars for this share of a year's periods to be included: all 12 monthly bars, as
+# in get_returns, and a few missing days or weeks to allow for holidays and sparse listings
+MIN_BAR_SHARE = 0.95
+
+
+def min_bars_per_year(interval='1mo'):
+    return math.ceil(PERIODS_PER_YEAR[interval] * MIN_BAR_SHARE)
+
+
+def year_window(year, interval='1mo'):
+    """
+    Date range [start, end) to fetch for a year. Monthly years run from the December bar of the
+    previous year to the last bar of the year. Daily and weekly years include Dec 31, and start
+    early enough to hold the last bar of the previous year, which is the base price of the year.
+    """
+    if interval == '1mo':
+        return f"{year-1}-12-01", f"{year}-12-31"
+    return f"{year-1}-12-01", f"{year+1}-01-01"
+
+
+def ticker_weights(tickers):
+    # A list of tickers is equal-weighted; duplicates count once
+    if isinstance(tickers, dict):
+        return tickers
+    return dict.fromkeys(tickers, 1.0)
+
+
+class ReturnsPanel:
+    """
+    Adjusted close prices of many tickers aligned on one date index (dates x tickers).
+
+    Missing bars are NaN. Portfolio returns are equal-weighted over the tickers that have
+    data: a ticker with fewer than min_bars_per_year(interval) bars in a year is left out of
+    that year, and a missing bar only drops that ticker from that period's average.
+    """
+
+    def __init__(self, prices, interval='1mo'):
+        self.prices = prices.sort_index().astype(float)
+        self.interval = interval
+        # Returns of every ticker by year, computed on first use; each ticker's returns only depend on its own prices
+        self._year_returns = {}
+
+    @classmethod
+    @instrumented('build_price_panel')
+    def from_cache(cls, price_cache, tickers, start_year, end_year, interval='1mo'):
+        start = year_window(start_year, interval)[0]
+        end = year_window(end_year, interval)[1]
+        price_cache.prefetch(tickers, start, end, interval)
+        return cls(price_cache.get_price_frame(tickers, start, end, interval), interval)
+
+    def year_rows(self, year):
+        # Positions [first, last) of a year's rows, from its base row (the last bar of the previous year) to its last bar
+        start, end = year_window(year, self.interval)
+        index = self.prices.index
+        if self.interval == '1mo':
+            return index.searchsorted(pd.Timestamp(start)), index.searchsorted(pd.Timestamp(end))
+        # Daily and weekly bars of the previous December other than the last are not part of the year
+        return max(index.searchsorted(pd.Timestamp(f"{year}-01-01")) - 1, 0), index.searchsorted(pd.Timestamp(end))
+
+    def year_returns(self, year, tickers=None):
+        """
+        Return (monthly, yearly) for a year: a DataFrame of monthly returns (months x tickers)
+        and a Series of yearly returns, NaN for tickers without enough data.
+
+        The date index holds the bars of every ticker, which trade on different calendars, so each
+        return is taken from the ticker's own previous bar and is NaN on dates the ticker has no bar.
+        """
+        if year not in self._year_returns:
+            first, last = self.year_rows(year)
+            window = self.prices.iloc[first:last]
+            enough_data = window.count() >= min_bars_per_year(self.interval)
+            window = window.loc[:, enough_data].reindex(columns=window.columns)
+
+            # Base price of each ticker: its last bar up to the base row, looking back at most a year
+            lookback = self.prices.iloc[max(first - PERIODS_PER_YEAR[self.interval], 0):first + 1].ffill()
+            anchored = window.copy()
+            if len(window):
+                anchored.iloc[0] = lookback.iloc[-1].where(enough_data)
+            filled = anchored.ffill()
+            monthly = (window / filled.shift(1) - 1).iloc[1:]
+            # Tickers without a bar before the year start from their first bar of the year
+            yearly = filled.iloc[-1] / filled.iloc[0].fillna(window.bfill().iloc[0]) - 1 if len(window) else pd.Series(np.nan, index=window.columns)
+            self._year_returns[year] = monthly, yearly
+        monthly, yearly = self._year_returns[year]
+        if tickers is not None:
+            columns = list(dict.fromkeys(tickers))
+            monthly, yearly = monthly.reindex(columns=columns), yearly.reindex(columns)
+        return monthly, yearly
+
+    @instrumented('portfolio_returns')
+    def portfolio_returns(self, selections, start_year, end_year):
+        """
+        Compute equal-weighted portfolio returns for several strategies at once.
+
+        selections maps a strategy name to {year: tickers}, where tickers is a list (equal
+        weights) or a {ticker: weight} dict. Weights are renormalized over the tickers with data.
+        Returns a dict mapping each strategy name to (monthly_returns, yearly_returns,
+        stock_details) keyed by year, in the format returned by calculate_returns_for_brands.
+        """
+        results = {name: ({}, {}, {}) for name in selections}
+        for year in range(start_year, end_year + 1):
+            year_tickers = {name: ticker_weights(by_year.get(year, [])) for name, by_year in selections.items()}
+            universe = list(dict.fromkeys(t for tickers in year_tickers.values() for t in tickers))
+            if not universe:
+                continue
+            monthly, yearly = self.year_returns(year, universe)
+
+            # Weight matrix (strategies x tickers), restricted to tickers with enough data
+            names = list(selections)
+            weights = np.zeros((len(names), len(universe)))
+            column = {ticker: i for i, ticker in enumerate(universe)}
+            for row, name in enumerate(names):
+                for ticker, weight in year_tickers[name].items():
+                    weights[row, column[ticker]] = weight
+            weights *= yearly.notna().to_numpy()
+
+            monthly_values = monthly.to_numpy()
+            monthly_valid = ~np.isnan(monthly_values)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                portfolio_monthly = (np.where(monthly_valid, monthly_values, 0.0) @ weights.T) / (monthly_valid @ weights.T)
+                portfolio_yearly = (weights @ yearly.fillna(0.0).to_numpy()) / weights.sum(axis=1)
+
+            for row, name in enumerate(names):
+                if weights[row].sum() == 0:
+                    continue
+                strategy_monthly, strategy_yearly, strategy_details = results[name]
+                months = portfolio_monthly[:, row]
+                traded = ~np.isnan(months)
+                strategy_monthly[year] = pd.Series(months[traded], index=monthly.index[traded].rename('date'))
+                strategy_yearly[year] = float(portfolio_yearly[row])
+                strategy_details[year] = [(ticker, float(yearly[ticker])) for ticker in year_tickers[name] if not np.isnan(yearly[ticker])]
+        return results
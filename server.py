@@ -0,0 +1,166 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from analysis_script import MARKET_TICKER, get_ticker_weights, get_tickers_for_brands, load_ticker_mapping
+from metrics import PERIODS_PER_YEAR
+from price_cache import DEFAULT_CACHE_PATH, PriceCache
+from rankings_store import get_rankings_store
+from result_store import metrics_from_sums
+from returns_panel import ReturnsPanel
+from strategies import DEFAULT_STRATEGIES, STRATEGIES
+from ticker_index import DEFAULT_MAPPING_PATH
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+def _json_value(value):
+    # NaN is not valid JSON, so metrics without a value are sent as null
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+class BacktestService:
+    """
+    Rankings table, ticker index and a price panel of every ranked brand's ticker, loaded once
+    and kept in memory to answer backtest queries without touching the disk or the network.
+    """
+
+    def __init__(self, rankings_directory='BrandData', mapping_path=DEFAULT_MAPPING_PATH, offline=True,
+                 price_cache_path=DEFAULT_CACHE_PATH, price_provider=None, frequency='1mo', normalized_ticker_matching=False):
+        self.rankings_directory = rankings_directory
+        self.frequency = frequency
+        self.store = get_rankings_store(rankings_directory)
+        self.ticker_mapping = load_ticker_mapping(mapping_path, normalized_ticker_matching)
+        self.ticker_mapping.join_rankings(self.store.table)
+        self.years = self.store.years
+        # Requests for more brands than any year ranks are capped, which also bounds the selections cache
+        self.max_brands = int(self.store.table.groupby('year').size().max())
+        tickers = self.ticker_mapping.join(self.store.table[['brand', 'year']])['ticker'].dropna().unique().tolist()
+        price_cache = PriceCache(price_cache_path, offline=offline, provider=price_provider)
+        self.panel = ReturnsPanel.from_cache(price_cache, tickers + [MARKET_TICKER], self.years[0], self.years[-1], frequency)
+        price_cache.close()
+        # Compute every year's returns up front so the first query is as fast as the rest
+        for year in self.years:
+            self.panel.year_returns(year)
+        self.selections = {}
+        # pandas is not thread-safe for concurrent use of the same objects, so queries run one at a time
+        self.lock = threading.Lock()
+
+    def select(self, strategy_name, number_of_brands, year):
+        key = (strategy_name, number_of_brands, year)
+        if key not in self.selections:
+            brands = STRATEGIES[strategy_name].select(self.rankings_directory, year, number_of_brands)
+            if isinstance(brands, pd.Series):
+                self.selections[key] = get_ticker_weights(self.ticker_mapping, brands, year)
+            else:
+                self.selections[key] = get_tickers_for_brands(self.ticker_mapping, brands, year)
+        return self.selections[key]
+
+    def backtest(self, strategies=None, start_year=None, end_year=None, number_of_brands=10, market=True):
+        """
+        Net return, annualized return, Sharpe ratio and yearly returns of each strategy (and the
+        market) over [start_year, end_year], as a JSON-serializable dict. number_of_brands is
+        capped at the number of brands ranked in the largest year.
+        """
+        strategies = list(strategies or DEFAULT_STRATEGIES)
+        if number_of_brands < 1:
+            raise ValueError('number_of_brands must be at least 1')
+        number_of_brands = min(number_of_brands, self.max_brands)
+        start_year = start_year or self.years[0]
+        end_year = end_year or self.years[-1]
+        unknown = [name for name in strategies if name not in STRATEGIES]
+        if unknown:
+            raise ValueError(f'Unknown strategies: {unknown}')
+        if start_year > end_year or start_year < self.years[0] or end_year > self.years[-1]:
+            raise ValueError(f'Years must be within {self.years[0]}-{self.years[-1]}')
+
+        years = range(start_year, end_year + 1)
+        with self.lock:
+            selections = {name: {year: self.select(name, number_of_brands, year) for year in years} for name in strategies}
+            if market:
+                selections['market'] = {year: [MARKET_TICKER] for year in years}
+            results = self.panel.portfolio_returns(selections, start_year, end_year)
+
+        response = {}
+        for name, (monthly_returns, yearly_returns, _) in results.items():
+            held = [year for year in years if year in yearly_returns]
+            months = np.array([r for year in held for r in monthly_returns[year]])
+            metrics = metrics_from_sums(float(np.log1p([yearly_returns[year] for year in held]).sum()), len(held), len(months),
+                                        months.sum(), (months ** 2).sum(), PERIODS_PER_YEAR[self.frequency])
+            response[name] = {key: _json_value(value) for key, value in metrics.items()}
+            response[name]['yearly_returns'] = {str(year): yearly_returns[year] for year in held}
+        return response
+
+
+class BacktestHandler(BaseHTTPRequestHandler):
+    """
+    GET /backtest?strategies=top_brands,most_improved_exact&start_year=2015&end_year=2023&number_of_brands=20&market=1
+    GET /strategies
+    GET /health
+    """
+
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/backtest':
+                body = self.service.backtest(
+                    strategies=[name for name in query.get('strategies', '').split(',') if name] or None,
+                    start_year=int(query['start_year']) if 'start_year' in query else None,
+                    end_year=int(query['end_year']) if 'end_year' in query else None,
+                    number_of_brands=int(query.get('number_of_brands', 10)),
+                    market=query.get('market', '1') not in ('0', 'false'))
+            elif url.path == '/strategies':
+                body = {name: strategy.label for name, strategy in STRATEGIES.items()}
+            elif url.path == '/health':
+                body = {'status': 'ok', 'years': [self.service.years[0], self.service.years[-1]],
+                        'tickers': len(self.service.panel.prices.columns), 'frequency': self.service.frequency}
+            else:
+                self._send(404, {'error': f'Unknown path: {url.path}'})
+                return
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # Any other failure is the server's, but the client still gets a response rather than a dropped connection
+            self._send(500, {'error': f'{type(e).__name__}: {e}'})
+            return
+        self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Keep the console for startup messages; per-request logging would dominate it
+        pass
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    # Port 0 picks a free port, available as server.server_address[1]
+    handler = type('Handler', (BacktestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, **service_options):
+    service = BacktestService(**service_options)
+    server = make_server(service, host, port)
+    print(f'Serving backtests for {service.years[0]}-{service.years[-1]} over {len(service.panel.prices.columns)} tickers '
+          f'on http://{server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,188 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instrumentation import count, instrumented
+
+DEFAULT_SIMULATIONS = 100_000
+# Half a year of periods keeps most of the autocorrelation of the returns inside a block: 6 monthly, 26 weekly or 126 daily returns
+BLOCK_YEARS = 0.5
+# Simulations per task; each task has its own seed, so results do not depend on the number of processes
+DEFAULT_CHUNK_SIZE = 5_000
+
+# Year universes and strategies of a simulation worker, passed once per process instead of with every chunk of simulations
+_universes = None
+_strategies = None
+
+
+def _init_worker(universes, strategies):
+    global _universes, _strategies
+    _universes = universes
+    _strategies = strategies
+
+
+def default_block_length(periods_per_year=12):
+    return max(round(periods_per_year * BLOCK_YEARS), 1)
+
+
+def year_universe(panel, year, tickers):
+    """
+    Return (monthly, yearly) arrays for the tickers of a year's ranked universe that have enough
+    data: monthly returns (months x tickers, NaN for missing months) and yearly returns.
+    """
+    monthly, yearly = panel.year_returns(year, tickers)
+    has_data = yearly.notna().to_numpy()
+    return monthly.to_numpy()[:, has_data], yearly.to_numpy()[has_data]
+
+
+def null_metrics(log_growth, year_count, months, monthly_sum, monthly_sum_squares, periods_per_year=12):
+    # Vectorized result_store.metrics_from_sums over arrays of simulations
+    with np.errstate(invalid='ignore', divide='ignore'):
+        annualized_return = np.where(year_count > 0, np.exp(log_growth / year_count) - 1, 0.0)
+        variance = (monthly_sum_squares - monthly_sum ** 2 / months) / (months - 1)
+        sharpe_ratio = np.where((months > 1) & (variance > 0), (monthly_sum / months) / np.sqrt(variance) * (periods_per_year ** 0.5), np.nan)
+    return annualized_return, sharpe_ratio
+
+
+def sample_without_replacement(rng, population, size, simulations):
+    """
+    Draw simulations samples of size distinct indices below population, one sample per row.
+    """
+    if size * size >= 8 * population:
+        # The first size entries of each row's argpartition of random keys are a uniform sample
+        return rng.random((simulations, population), dtype=np.float32).argpartition(size - 1, axis=1)[:, :size]
+    # Floyd's algorithm, one column at a time for all rows; cheaper than random keys for small samples
+    picks = np.empty((simulations, size), dtype=np.intp)
+    for i, j in enumerate(range(population - size, population)):
+        candidate = rng.integers(0, j + 1, simulations)
+        taken = (picks[:, :i] == candidate[:, None]).any(axis=1)
+        picks[:, i] = np.where(taken, j, candidate)
+    return picks
+
+
+def random_portfolio_sums(universes, sizes, simulations, rng):
+    """
+    Draw simulations random equal-weighted portfolios per year, each of that year's size in
+    sizes, from the year's universe. Returns the per-simulation sums of yearly log growth, years,
+    months, monthly returns and squared monthly returns, as used by metrics_from_sums.
+    """
+    sums = np.zeros((5, simulations))
+    for (monthly, yearly), size in zip(universes, sizes):
+        size = min(size, len(yearly))
+        if size == 0:
+            continue
+        picks = sample_without_replacement(rng, len(yearly), size, simulations)
+        portfolio_yearly = yearly[picks].mean(axis=1)
+
+        # As in ReturnsPanel, a missing month only drops that ticker from that month's average.
+        # Holdings are added one pick at a time so memory stays at simulations x months.
+        has_month = ~np.isnan(monthly.T)
+        filled = np.where(has_month, monthly.T, 0.0)
+        total, holdings = np.zeros((simulations, len(monthly))), np.zeros((simulations, len(monthly)))
+        for column in picks.T:
+            total += filled[column]
+            holdings += has_month[column]
+        valid = holdings > 0
+        portfolio_monthly = np.divide(total, holdings, out=np.zeros_like(total), where=valid)
+
+        sums[0] += np.log1p(portfolio_yearly)
+        sums[1] += 1
+        sums[2] += valid.sum(axis=1)
+        sums[3] += portfolio_monthly.sum(axis=1)
+        sums[4] += (portfolio_monthly ** 2).sum(axis=1)
+    return sums
+
+
+def block_bootstrap(returns, simulations, block_length, rng):
+    """
+    Circular moving block bootstrap: simulations paths (simulations x len(returns)) built from
+    blocks of block_length consecutive returns starting at random positions.
+    """
+    length = len(returns)
+    blocks = -(-length // block_length)
+    starts = rng.integers(0, length, (simulations, blocks, 1))
+    index = (starts + np.arange(block_length)) % length
+    return returns[index.reshape(simulations, -1)[:, :length]]
+
+
+def _simulate(name, simulations, seed, block_length, periods_per_year):
+    """
+    Run one chunk of simulations of a strategy and return the null annualized returns and Sharpe
+    ratios of its random portfolios, and the null Sharpe ratios of its bootstrapped excess returns.
+    """
+    rng = np.random.default_rng(seed)
+    sizes, excess_returns = _strategies[name]
+    annualized_return, sharpe_ratio = null_metrics(*random_portfolio_sums(_universes, sizes, simulations, rng), periods_per_year=periods_per_year)
+
+    excess_sharpe_ratio = None
+    if excess_returns is not None and len(excess_returns) > 1:
+        # Under the null the strategy has no edge over the market, so the excess returns are centred on zero
+        paths = block_bootstrap(excess_returns - excess_returns.mean(), simulations, block_length, rng)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            excess_sharpe_ratio = paths.mean(axis=1) / paths.std(axis=1, ddof=1) * (periods_per_year ** 0.5)
+    return name, annualized_return, sharpe_ratio, excess_sharpe_ratio
+
+
+def p_value(null, observed):
+    # One-sided Monte Carlo p-value of observing a value at least as high under the null
+    null = null[~np.isnan(null)]
+    if np.isnan(observed) or len(null) == 0:
+        return np.nan
+    return float((1 + np.sum(null >= observed)) / (len(null) + 1))
+
+
+@instrumented()
+def significance_tests(universes, strategies, simulations=DEFAULT_SIMULATIONS, block_length=None, periods_per_year=12,
+                       seed=0, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Test each strategy's annualized return and Sharpe ratio against random portfolios.
+
+    universes is a list of (monthly, yearly) arrays per year, from year_universe. strategies maps
+    a name to (sizes, excess_returns, observed), where sizes is the number of holdings of each
+    year, excess_returns the strategy's monthly returns minus the market's (or None) and observed
+    a dict with the strategy's 'annualized_return' and 'sharpe_ratio'.
+
+    Each strategy gets simulations random equal-weighted portfolios of its sizes, redrawn every
+    year, and simulations block-bootstrapped paths of its demeaned excess returns. Simulations
+    run in chunks across a process pool; every chunk is seeded from seed and its position, so
+    results are reproducible for any number of processes. Returns a dict mapping each name to
+    its p-values and the mean of the null distributions. block_length defaults to half a year
+    of periods, see default_block_length.
+    """
+    if block_length is None:
+        block_length = default_block_length(periods_per_year)
+    seeds = np.random.SeedSequence(seed).spawn(len(strategies) * -(-simulations // chunk_size))
+    tasks = []
+    for name in strategies:
+        for start in range(0, simulations, chunk_size):
+            tasks.append((name, min(chunk_size, simulations - start), seeds[len(tasks)], block_length, periods_per_year))
+    worker_strategies = {name: (sizes, excess_returns) for name, (sizes, excess_returns, _) in strategies.items()}
+
+    processes = processes or os.cpu_count()
+    if processes > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(min(processes, len(tasks)), initializer=_init_worker, initargs=(universes, worker_strategies)) as executor:
+            futures = [executor.submit(_simulate, *task) for task in tasks]
+            chunks = [future.result() for future in futures]
+    else:
+        _init_worker(universes, worker_strategies)
+        chunks = [_simulate(*task) for task in tasks]
+    count('random_portfolios', len(strategies) * simulations)
+
+    results = {}
+    for name, (_, excess_returns, observed) in strategies.items():
+        own = [chunk for chunk in chunks if chunk[0] == name]
+        null_return = np.concatenate([chunk[1] for chunk in own])
+        null_sharpe = np.concatenate([chunk[2] for chunk in own])
+        results[name] = {
+            'p_value_annualized_return': p_value(null_return, observed['annualized_return']),
+            'p_value_sharpe_ratio': p_value(null_sharpe, observed['sharpe_ratio']),
+            'null_annualized_return': float(np.nanmean(null_return)),
+            'null_sharpe_ratio': float(np.nanmean(null_sharpe)),
+            'p_value_vs_market': np.nan,
+        }
+        if own[0][3] is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                excess_sharpe_ratio = excess_returns.mean() / excess_returns.std(ddof=1) * (periods_per_year ** 0.5)
+            results[name]['p_value_vs_market'] = p_value(np.concatenate([chunk[3] for chunk in own]), excess_sharpe_ratio)
+    return results
@@ -0,0 +1,88 @@
+import pandas as pd
+
+from rankings_store import get_rankings_store
+
+# Ratings from best to worst; each grade also comes with a + and - modifier
+RATING_GRADES = ['AAA', 'AA', 'A', 'BBB', 'BB', 'B', 'CCC', 'CC', 'C', 'D']
+RATING_MODIFIERS = {'+': 0, '': 1, '-': 2}
+
+
+class Strategy:
+    """
+    A named selection rule over the rankings table.
+
+    rule(store, year, number_of_brands) returns the selected brands of a year, either as a list
+    (equal-weighted) or as a Series of weights indexed by brand.
+    """
+
+    def __init__(self, name, label, rule):
+        self.name = name
+        self.label = label
+        self.rule = rule
+
+    def select(self, rankings_directory, year, number_of_brands):
+        return self.rule(get_rankings_store(rankings_directory), year, number_of_brands)
+
+
+STRATEGIES = {}
+# The strategies main evaluates when no list is given, matching its calculate_* flags
+DEFAULT_STRATEGIES = ['top_brands', 'most_improved_exact', 'most_improved_weighted']
+
+
+def register_strategy(name, label):
+    """
+    Decorator that adds a selection rule to the registry under name, shown as label in reports.
+    """
+    def decorator(rule):
+        STRATEGIES[name] = Strategy(name, label, rule)
+        return rule
+    return decorator
+
+
+def rating_score(rating):
+    # Lower is better: AAA+ is 0, AAA is 1, AAA- is 2, AA+ is 3, ...
+    if not isinstance(rating, str):
+        return None
+    grade, modifier = rating.rstrip('+-'), rating[len(rating.rstrip('+-')):]
+    if grade not in RATING_GRADES or modifier not in RATING_MODIFIERS:
+        return None
+    return RATING_GRADES.index(grade) * len(RATING_MODIFIERS) + RATING_MODIFIERS[modifier]
+
+
+@register_strategy('top_brands', 'Top Brands')
+def top_brands(store, year, number_of_brands):
+    return store.select(year, 'top', number_of_brands)
+
+
+@register_strategy('most_improved_exact', 'Most Improved Brands (Exact)')
+def most_improved_exact(store, year, number_of_brands):
+    return store.select(year, 'most_improved_exact', number_of_brands)
+
+
+@register_strategy('most_improved_weighted', 'Most Improved Brands (Weighted)')
+def most_improved_weighted(store, year, number_of_brands):
+    return store.select(year, 'most_improved_weighted', number_of_brands)
+
+
+@register_strategy('value_weighted', 'Top Brands (Value Weighted)')
+def value_weighted(store, year, number_of_brands):
+    # The top brands, each weighted by its brand value
+    top = store.year(year).sort_values('position').head(number_of_brands)
+    return pd.Series(top['value'].fillna(0).to_numpy(), index=top['brand'])
+
+
+@register_strategy('rating_upgrade', 'Rating Upgrades')
+def rating_upgrade(store, year, number_of_brands):
+    # The best-ranked brands whose rating improved over the previous year
+    rankings = store.year(year)
+    # Ratings are categoricals, and mapping one whose categories all parse gives another categorical, so scores are cast to float
+    upgrade = rankings['previous_rating'].map(rating_score).astype(float) - rankings['rating'].map(rating_score).astype(float)
+    return rankings[upgrade > 0].sort_values('position').head(number_of_brands)['brand'].tolist()
+
+
+@register_strategy('brand_value_growth', 'Brand Value Growth')
+def brand_value_growth(store, year, number_of_brands):
+    # The brands whose value grew the most over the previous year
+    rankings = store.year(year)
+    growth = rankings['value'] / rankings['previous_value'] - 1
+    return rankings['brand'][growth.dropna().sort_values(ascending=False).index].head(number_of_brands).tolist()
@@ -0,0 +1,145 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis_script import MARKET_TICKER, load_ticker_mapping
+from price_cache import DEFAULT_CACHE_PATH, PriceCache
+from rankings_store import SELECTION_METHODS, get_rankings_store
+from result_store import metrics_from_sums
+from returns_panel import ReturnsPanel
+from ticker_index import DEFAULT_MAPPING_PATH
+
+# Price panel, ticker selections and years shared by every sweep task of a worker process, so tasks only carry a method and brand counts
+_panel = None
+_selections = None
+_years = None
+
+
+def _init_worker(prices_path, index, columns, selections, years):
+    global _panel, _selections, _years
+    # The price matrix is memory-mapped, so all workers share the same pages instead of each holding a copy
+    prices = np.load(prices_path, mmap_mode='r')
+    _panel = ReturnsPanel(pd.DataFrame(prices, index=index, columns=columns, copy=False))
+    _selections = selections
+    _years = years
+
+
+def yearly_aggregates(panel, selections, years):
+    """
+    Evaluate the strategies in selections ({name: {year: [tickers]}}) for every year and return
+    {name: array of shape (len(years), 5)} with the columns yearly return, log growth,
+    number of months, sum and sum of squares of monthly returns. Years without data are NaN.
+    """
+    results = panel.portfolio_returns(selections, years[0], years[-1])
+    aggregates = {}
+    for name, (monthly_returns, yearly_returns, _) in results.items():
+        rows = np.full((len(years), 5), np.nan)
+        for i, year in enumerate(years):
+            if year not in yearly_returns:
+                continue
+            months = np.asarray(monthly_returns[year])
+            rows[i] = [yearly_returns[year], np.log1p(yearly_returns[year]), len(months), months.sum(), (months ** 2).sum()]
+        aggregates[name] = rows
+    return aggregates
+
+
+def window_metrics(aggregates, years, start_years, end_years):
+    """
+    Return a DataFrame of net return, annualized return and Sharpe ratio for every
+    (start_year, end_year) window, computed from prefix sums of the yearly aggregates.
+    """
+    available = ~np.isnan(aggregates[:, 0])
+    filled = np.where(available[:, None], aggregates, 0.0)
+    prefix = np.vstack([np.zeros((1, filled.shape[1] + 1)), np.cumsum(np.column_stack([filled, available]), axis=0)])
+    position = {year: i for i, year in enumerate(years)}
+
+    rows = []
+    for start_year in start_years:
+        for end_year in end_years:
+            if end_year < start_year or start_year not in position or end_year not in position:
+                continue
+            totals = prefix[position[end_year] + 1] - prefix[position[start_year]]
+            _, log_growth, months, monthly_sum, monthly_sum_squares, year_count = totals
+            if year_count == 0:
+                continue
+            metrics = metrics_from_sums(log_growth, year_count, months, monthly_sum, monthly_sum_squares)
+            rows.append((start_year, end_year, int(year_count), metrics['net_return'], metrics['annualized_return'], metrics['sharpe_ratio']))
+    return pd.DataFrame(rows, columns=['start_year', 'end_year', 'years', 'net_return', 'annualized_return', 'sharpe_ratio'])
+
+
+def _evaluate(method, brand_counts, start_years, end_years):
+    selections = {number_of_brands: {year: [ticker for ticker in tickers[:number_of_brands] if ticker is not None]
+                                     for year, tickers in _selections[method].items()}
+                  for number_of_brands in brand_counts}
+    frames = []
+    for number_of_brands, aggregates in yearly_aggregates(_panel, selections, _years).items():
+        frame = window_metrics(aggregates, _years, start_years, end_years)
+        frame.insert(0, 'number_of_brands', number_of_brands)
+        frame.insert(0, 'method', method)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_sweep(rankings_directory, brand_counts=range(5, 101, 5), start_years=None, end_years=None, methods=SELECTION_METHODS,
+              with_market=True, processes=None, offline=None, price_cache_path=DEFAULT_CACHE_PATH,
+              price_provider=None, output_path='data/sweep_results.csv', mapping_path=DEFAULT_MAPPING_PATH, normalized_ticker_matching=False):
+    """
+    Evaluate every combination of brand count, start/end year window and selection method
+    across a process pool and write one results table. With with_market, each row also holds
+    the market's annualized return and Sharpe ratio over its window and the excess return.
+    """
+    store = get_rankings_store(rankings_directory)
+    ticker_mapping = load_ticker_mapping(mapping_path, normalized_ticker_matching)
+    brand_counts = sorted(set(brand_counts))
+    start_years = list(start_years or store.years)
+    end_years = list(end_years or store.years)
+    years = list(range(min(start_years), max(end_years) + 1))
+
+    # Ticker of each brand of the largest portfolio of each method and year (None if unmapped).
+    # Smaller portfolios take a prefix of the brands, so unmapped brands shrink them as in main.
+    ticker_mapping.join_rankings(store.table)
+    selections = {}
+    for method in methods:
+        selections[method] = {}
+        for year in years:
+            brands = store.select(year, method, max(brand_counts))
+            selections[method][year] = ticker_mapping.resolve(brands, year)
+
+    tickers = [ticker for by_year in selections.values() for year_tickers in by_year.values() for ticker in year_tickers if ticker is not None]
+    price_cache = PriceCache(price_cache_path, offline=offline, provider=price_provider)
+    panel = ReturnsPanel.from_cache(price_cache, tickers + [MARKET_TICKER], years[0], years[-1])
+
+    with tempfile.TemporaryDirectory() as shared_directory:
+        prices_path = os.path.join(shared_directory, 'prices.npy')
+        np.save(prices_path, panel.prices.to_numpy())
+
+        processes = processes or os.cpu_count()
+        # Split the brand counts so there are enough tasks to keep every process busy
+        chunk_count = max(1, -(-processes // len(methods)))
+        chunks = [chunk.tolist() for chunk in np.array_split(brand_counts, chunk_count) if len(chunk)]
+        with ProcessPoolExecutor(processes, initializer=_init_worker,
+                                 initargs=(prices_path, panel.prices.index, panel.prices.columns, selections, years)) as executor:
+            futures = [executor.submit(_evaluate, method, chunk, start_years, end_years) for method in methods for chunk in chunks]
+            results = pd.concat([future.result() for future in futures], ignore_index=True)
+
+    # The market does not change a strategy's metrics, so it is added as columns of each configuration
+    if with_market:
+        market = window_metrics(
+            yearly_aggregates(panel, {'market': {year: [MARKET_TICKER] for year in years}}, years)['market'],
+            years, start_years, end_years)
+        market = market[['start_year', 'end_year', 'annualized_return', 'sharpe_ratio']].rename(
+            columns={'annualized_return': 'market_annualized_return', 'sharpe_ratio': 'market_sharpe_ratio'})
+        results = results.merge(market, on=['start_year', 'end_year'], how='left')
+        results['excess_annualized_return'] = results['annualized_return'] - results['market_annualized_return']
+
+    if output_path:
+        results.to_csv(output_path, index=False)
+        print(f'Sweep of {len(results)} configurations saved to: {output_path}')
+    return results
+
+
+if __name__ == "__main__":
+    run_sweep('BrandData')
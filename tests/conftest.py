@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_DIRECTORY)
+sys.path.insert(0, os.path.join(REPOSITORY_DIRECTORY, 'benchmarks'))
+
+import synthetic_data
+
+START_YEAR = 2019
+END_YEAR = 2021
+
+
+@pytest.fixture(scope='session')
+def synthetic_inputs(tmp_path_factory):
+    """
+    Rankings directory, brand-to-ticker mapping CSV and local price provider of a small synthetic
+    universe, as generated for the benchmarks. Nothing touches the network.
+    """
+    directory = tmp_path_factory.mktemp('synthetic')
+    rankings_directory = synthetic_data.write_rankings(str(directory / 'rankings'), 200, START_YEAR, END_YEAR)
+    mapping = synthetic_data.ticker_mapping(200, 60)
+    mapping_path = str(directory / 'mapping.csv')
+    pd.DataFrame({'Brand': list(mapping), 'Ticker': list(mapping.values())}).to_csv(mapping_path, index=False)
+    provider = synthetic_data.write_prices(str(directory / 'prices'), set(mapping.values()) - {'N/A'}, START_YEAR, END_YEAR)
+    return {'rankings_directory': rankings_directory, 'mapping_path': mapping_path, 'price_provider': provider,
+            'price_cache_path': str(directory / 'price_cache.sqlite')}
@@ -0,0 +1,36 @@
+import json
+import os
+import tracemalloc
+
+import pytest
+
+import analysis_script
+from conftest import END_YEAR, START_YEAR
+from instrumentation import get_profiler
+
+
+def run_main(synthetic_inputs, report_directory, **options):
+    analysis_script.main(synthetic_inputs['rankings_directory'], start_year=START_YEAR, end_year=END_YEAR,
+                         price_provider=synthetic_inputs['price_provider'], price_cache_path=synthetic_inputs['price_cache_path'],
+                         result_store_path=None, mapping_path=synthetic_inputs['mapping_path'], report_directory=str(report_directory),
+                         report_formats=('csv',), **options)
+
+
+def test_profile_is_written_to_the_report_directory(synthetic_inputs, tmp_path):
+    run_main(synthetic_inputs, tmp_path, cprofile=True, track_memory=True, rolling_window=12)
+    with open(tmp_path / 'run_profile.json') as f:
+        profile = json.load(f)
+    assert 'peak_traced_mb' in profile['stages']['main']
+    assert os.path.exists(tmp_path / 'run_profile.prof')
+    assert os.path.exists(tmp_path / 'rolling_metrics.csv')
+    assert get_profiler() is None and not tracemalloc.is_tracing()
+
+
+def test_failed_run_stops_the_profiler(synthetic_inputs, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('no prices')
+
+    monkeypatch.setattr(analysis_script, 'evaluate_strategies', fail)
+    with pytest.raises(RuntimeError):
+        run_main(synthetic_inputs, tmp_path, track_memory=True)
+    assert get_profiler() is None and not tracemalloc.is_tracing()
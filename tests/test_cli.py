@@ -0,0 +1,47 @@
+import pytest
+
+import cli
+from price_cache import DEFAULT_CACHE_PATH
+from result_store import DEFAULT_RESULT_STORE_PATH
+from strategies import DEFAULT_STRATEGIES
+from ticker_index import DEFAULT_MAPPING_PATH
+
+
+def parse(argv):
+    parser = cli.build_parser()
+    args = parser.parse_args(argv)
+    cli.apply_defaults(parser, args)
+    return args
+
+
+def test_defaults_come_from_the_modules_that_use_them():
+    args = parse(['backtest'])
+    assert (args.price_cache, args.mapping, args.strategies) == (DEFAULT_CACHE_PATH, DEFAULT_MAPPING_PATH, DEFAULT_STRATEGIES)
+    assert args.result_store == DEFAULT_RESULT_STORE_PATH
+    assert parse(['report', '--result-store', 'results.sqlite']).result_store == 'results.sqlite'
+    args = parse(['sweep', '--mapping', 'mapping.csv', '--price-cache', 'prices.sqlite'])
+    assert (args.price_cache, args.mapping) == ('prices.sqlite', 'mapping.csv')
+    assert 'strategies' not in args and 'result_store' not in args
+
+
+def test_unknown_strategies_are_a_usage_error(capsys):
+    with pytest.raises(SystemExit) as error:
+        cli.main(['report', '--strategies', 'top_brands', 'best_brands'])
+    assert error.value.code == 2
+    assert 'unknown strategies: best_brands' in capsys.readouterr().err
+
+
+def test_fetch_is_always_online(capsys, monkeypatch, tmp_path):
+    with pytest.raises(SystemExit) as error:
+        cli.main(['fetch', '--offline'])
+    assert error.value.code == 2
+    assert 'cannot run --offline' in capsys.readouterr().err
+
+    # The environment variable makes the other commands offline, but not fetch
+    monkeypatch.setenv('BRANDSTOCK_OFFLINE', '1')
+    caches = []
+    monkeypatch.setattr('price_cache.PriceCache.prefetch', lambda cache, *args: caches.append(cache))
+    monkeypatch.setattr('analysis_script.select_strategy_tickers', lambda *args: {2015: ['AAPL']})
+    monkeypatch.setattr('analysis_script.load_ticker_mapping', lambda *args: None)
+    cli.main(['fetch', '--price-cache', str(tmp_path / 'prices.sqlite')])
+    assert len(caches) == 1 and caches[0].offline is False
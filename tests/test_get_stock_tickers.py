@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from get_stock_tickers import TickerLookupCache, TokenBucket, find_stock_tickers, resolve_tickers
+
+# Brands the stub search answers for, with the exchange of the quote it returns
+STUB_QUOTES = {
+    'Apple': [{'symbol': 'AAPL', 'exchange': 'NMS'}],
+    'Nestle': [{'symbol': 'NSRGY', 'exchange': 'PINK'}, {'symbol': 'NESN.SW', 'exchange': 'EBS'}],
+    'Toyota': [{'symbol': 'TM', 'exchange': 'NYQ'}],
+    'Unlisted': [],
+}
+
+
+class StubSearch:
+    """
+    Local stand-in for the Yahoo search endpoint. Records the query and time of every request,
+    and fails the first request for each brand in failing with a 500.
+    """
+
+    def __init__(self, failing=()):
+        self.requests = []
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)['q'][0]
+                with stub.lock:
+                    stub.requests.append((query, time.monotonic()))
+                    failed = query in stub.failing
+                    stub.failing.discard(query)
+                if failed:
+                    self.send_error(500)
+                    return
+                payload = json.dumps({'quotes': STUB_QUOTES.get(query, [])}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1/finance/search'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def queries(self):
+        return [query for query, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubSearch(failing={'Toyota'})
+    yield stub
+    stub.close()
+
+
+def test_token_bucket_allows_a_burst_then_limits_the_rate():
+    async def acquire_times(bucket, count):
+        times = []
+        for _ in range(count):
+            await bucket.acquire()
+            times.append(time.monotonic())
+        return times
+
+    bucket = TokenBucket(rate=20, capacity=5)
+    start = time.monotonic()
+    times = asyncio.run(acquire_times(bucket, 10))
+    # The first 5 come from the full bucket, the other 5 at 20 per second
+    assert times[4] - start < 0.05
+    assert times[-1] - start >= 5 / 20 * 0.9
+
+
+def test_lookup_cache_save_is_atomic(tmp_path, monkeypatch):
+    path = str(tmp_path / 'lookups.json')
+    cache = TickerLookupCache(path)
+    cache.set('Apple', 'AAPL')
+    cache.save()
+    assert TickerLookupCache(path).lookups == {'Apple': 'AAPL'}
+
+    def interrupted_dump(lookups, f, **kwargs):
+        f.write('{"Apple": "AA')
+        raise KeyboardInterrupt
+
+    cache.set('Toyota', 'TM')
+    monkeypatch.setattr(json, 'dump', interrupted_dump)
+    with pytest.raises(KeyboardInterrupt):
+        cache.save()
+    monkeypatch.undo()
+    # The checkpoint still holds the last complete save
+    assert TickerLookupCache(path).lookups == {'Apple': 'AAPL'}
+
+
+def test_resolve_tickers_against_stub(stub, tmp_path, monkeypatch):
+    saves = []
+    save = TickerLookupCache.save
+    monkeypatch.setattr(TickerLookupCache, 'save', lambda cache: saves.append(dict(cache.lookups)) or save(cache))
+    cache = TickerLookupCache(str(tmp_path / 'lookups.json'))
+    asyncio.run(resolve_tickers(list(STUB_QUOTES) * 2, cache, url=stub.url, rate=10, concurrency=4, checkpoint_every=1))
+
+    # Each brand is requested once; the failed lookup is not cached, so the next run retries it
+    assert sorted(stub.queries()) == sorted(STUB_QUOTES)
+    assert cache.lookups == {'Apple': 'AAPL', 'Nestle': 'NSRGY', 'Unlisted': 'N/A'}
+    # A checkpoint after every successful lookup, growing by one brand each time, and a final save
+    assert [len(lookups) for lookups in saves] == [1, 2, 3, 3]
+
+    # Resuming from the checkpoint only looks up what is missing
+    resumed = TickerLookupCache(cache.path)
+    assert resumed.lookups == cache.lookups
+    asyncio.run(resolve_tickers(list(STUB_QUOTES), resumed, url=stub.url, rate=10, concurrency=4))
+    assert stub.queries()[len(STUB_QUOTES):] == ['Toyota']
+    assert TickerLookupCache(cache.path).get('Toyota') == 'TM'
+
+
+def test_rate_limit_against_stub(tmp_path):
+    stub = StubSearch()
+    try:
+        brands = [f'Brand {i}' for i in range(30)]
+        cache = TickerLookupCache(str(tmp_path / 'lookups.json'))
+        start = time.monotonic()
+        asyncio.run(resolve_tickers(brands, cache, url=stub.url, rate=20, concurrency=4))
+    finally:
+        stub.close()
+    times = sorted(t for _, t in stub.requests)
+    assert len(times) == 30
+    # The bucket starts with 20 tokens and refills at 20 per second, so the last 10 requests take at least half a second
+    assert times[-1] - start >= 10 / 20 * 0.9
+    # No request ever goes beyond the bucket: the n-th request is sent after (n - 20) / 20 seconds
+    assert all(n - 20 <= 20 * (t - start) + 0.5 for n, t in enumerate(times, start=1))
+
+
+def test_find_stock_tickers_writes_tickers_next_to_the_input(stub, tmp_path):
+    file_path = str(tmp_path / 'unique_companies.csv')
+    with open(file_path, 'w') as f:
+        f.write('Brand\nApple\nNestle\n')
+    updated_file_path = find_stock_tickers(file_path, url=stub.url, rate=50)
+    with open(updated_file_path) as f:
+        assert f.read().splitlines() == ['Brand,Ticker', 'Apple,AAPL', 'Nestle,NSRGY']
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_script import rolling_metrics_frame, stack_returns
+from metrics import compute_metrics, rolling_metrics
+
+
+def dated(year, values):
+    return pd.Series(values, index=pd.date_range(f'{year}-01-01', periods=len(values), freq='MS'))
+
+
+def test_stacked_returns_match_each_series():
+    results = {'a': ({2020: dated(2020, [0.01, -0.02, 0.03]), 2021: dated(2021, [0.02, 0.01])}, {}, {}),
+               'market': ({2020: dated(2020, [0.0, 0.01, -0.01]), 2021: dated(2021, [0.01])}, {}, {})}
+    returns, row_years = stack_returns(results, 2020, 2021)
+    assert returns.shape == (5, 2)
+    assert row_years.tolist() == [2020, 2020, 2020, 2021, 2021]
+    assert np.isnan(returns[4, 1])
+
+    metrics = compute_metrics(returns, 12, returns[:, 1])
+    single = compute_metrics(np.array([0.01, -0.02, 0.03, 0.02, 0.01]))
+    for name in ['periods', 'sharpe_ratio', 'max_drawdown', 'historical_var']:
+        assert metrics[name][0] == pytest.approx(single[name][0])
+    assert metrics['beta'][1] == pytest.approx(1.0)
+
+
+def test_stacked_returns_line_up_by_date():
+    stock = pd.Series(np.random.default_rng(3).normal(0.0, 0.02, 20), index=pd.bdate_range('2020-01-02', periods=20))
+    # The market is the same series without its fifth day, so every later return lines up only by date
+    results = {'stock': ({2020: stock}, {}, {}), 'market': ({2020: stock.drop(stock.index[4])}, {}, {})}
+    returns, _ = stack_returns(results, 2020, 2020)
+    assert np.isnan(returns[4, 1])
+    assert compute_metrics(returns, 252, returns[:, 1])['beta'][0] == pytest.approx(1.0)
+
+
+def test_memory_mapped_returns_match_in_memory(tmp_path):
+    results = {'a': ({2020: dated(2020, np.linspace(-0.05, 0.05, 12))}, {}, {})}
+    returns, _ = stack_returns(results, 2020, 2020, str(tmp_path / 'returns.npy'))
+    assert isinstance(returns, np.memmap)
+    np.testing.assert_allclose(np.load(tmp_path / 'returns.npy'), stack_returns(results, 2020, 2020)[0])
+
+
+def test_rolling_metrics_do_not_depend_on_the_chunk_size(tmp_path):
+    returns = np.random.default_rng(0).normal(0.01, 0.05, size=(40, 3))
+    benchmark = returns[:, 0]
+    single = rolling_metrics(returns, 6, benchmark=benchmark, chunk_size=len(returns))
+    chunked = rolling_metrics(returns, 6, benchmark=benchmark, chunk_size=7, out_directory=str(tmp_path))
+    for name, values in single.items():
+        np.testing.assert_allclose(chunked[name], values)
+    expected = pd.Series(returns[:, 1]).rolling(6).std() * 12 ** 0.5
+    np.testing.assert_allclose(single['rolling_volatility'][:, 1], expected)
+
+
+def test_rolling_metrics_frame_leaves_out_partial_windows():
+    returns = np.random.default_rng(1).normal(0.01, 0.05, size=(24, 2))
+    metrics = compute_metrics(returns, 12, returns[:, 1], rolling_window=12)
+    frame = rolling_metrics_frame(metrics, np.repeat([2020, 2021], 12), ['A', 'Market'])
+    assert len(frame) == 2 * 13
+    assert frame.iloc[0][['year', 'period', 'strategy']].tolist() == [2020, 12, 'A']
+    assert frame['rolling_beta'][frame['strategy'] == 'Market'].tolist() == pytest.approx([1.0] * 13)
+
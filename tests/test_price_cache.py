@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import price_cache
+from price_cache import PriceCache
+from price_providers import PriceProvider
+
+
+class StubProvider(PriceProvider):
+    """
+    Monthly bars of 2015 for every ticker, or nothing for tickers listed in failing, as yfinance
+    returns on rate limits and network errors. Records every request.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.requests = []
+
+    def fetch(self, tickers, start, end, interval='1mo'):
+        self.requests.append((list(tickers), start, end))
+        dates = pd.date_range('2014-12-01', '2015-12-01', freq='MS')
+        dates = dates[(dates >= start) & (dates < end)]
+        return pd.DataFrame({ticker: [float('nan') if ticker in self.failing else 100.0 + i for i in range(len(dates))]
+                             for ticker in tickers}, index=dates)
+
+
+def test_prices_are_fetched_once(tmp_path):
+    provider = StubProvider()
+    cache = PriceCache(str(tmp_path / 'prices.sqlite'), offline=False, provider=provider)
+    cache.prefetch(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31')
+    # Both tickers miss the same range, so they are fetched in one request
+    assert provider.requests == [(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31')]
+    prices = cache.get_prices('AAPL', '2015-01-01', '2015-12-31')
+    assert len(prices) == 12 and prices.iloc[0] == 101.0
+    assert len(provider.requests) == 1
+    assert cache.missing_ranges('AAPL', '2014-06-01', '2015-12-31') == [('2014-06-01', '2014-12-01')]
+
+
+def test_offline_never_calls_the_provider(tmp_path):
+    provider = StubProvider()
+    cache = PriceCache(str(tmp_path / 'prices.sqlite'), offline=True, provider=provider)
+    assert cache.get_prices('AAPL', '2014-12-01', '2015-12-31').empty
+    assert provider.requests == []
+
+
+@pytest.mark.parametrize('environment, offline', [('1', True), ('0', False), (None, False)])
+def test_offline_follows_the_environment(tmp_path, monkeypatch, environment, offline):
+    if environment is None:
+        monkeypatch.delenv('BRANDSTOCK_OFFLINE', raising=False)
+    else:
+        monkeypatch.setenv('BRANDSTOCK_OFFLINE', environment)
+    assert PriceCache(str(tmp_path / 'prices.sqlite'), provider=StubProvider()).offline is offline
+    assert PriceCache(str(tmp_path / 'prices.sqlite'), offline=False, provider=StubProvider()).offline is False
+
+
+def test_empty_results_expire(tmp_path):
+    path = str(tmp_path / 'prices.sqlite')
+    provider = StubProvider(failing={'AAPL'})
+    cache = PriceCache(path, offline=False, provider=provider)
+    cache.prefetch(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31')
+    # Within max_age_days, the empty result is not requested again
+    assert cache.missing_ranges('AAPL', '2014-12-01', '2015-12-31') == []
+    cache.close()
+
+    # Once it is older than empty_max_age_days it is dropped and fetched again; the closed range with bars is kept
+    provider.failing.clear()
+    cache = PriceCache(path, offline=False, max_age_days=0, empty_max_age_days=0, provider=provider)
+    assert cache.missing_ranges('AAPL', '2014-12-01', '2015-12-31') == [('2014-12-01', '2015-12-31')]
+    assert cache.missing_ranges('MSFT', '2014-12-01', '2015-12-31') == []
+    assert len(cache.get_prices('AAPL', '2014-12-01', '2015-12-31')) == 13
+
+
+def test_empty_results_do_not_change_the_version(tmp_path):
+    path = str(tmp_path / 'prices.sqlite')
+    provider = StubProvider(failing={'AAPL'})
+    cache = PriceCache(path, offline=False, provider=provider)
+    cache.prefetch(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31')
+    version = cache.version(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31')
+    cache.close()
+
+    # Complete ranges without bars are kept longer than open ranges, and fetching them again without bars adds no prices
+    assert PriceCache(path, offline=False, max_age_days=0, provider=provider).missing_ranges('AAPL', '2014-12-01', '2015-12-31') == []
+    cache = PriceCache(path, offline=False, empty_max_age_days=0, provider=provider)
+    cache.prefetch(['AAPL'], '2014-12-01', '2015-12-31')
+    assert len(provider.requests) == 2
+    assert cache.version(['AAPL', 'MSFT'], '2014-12-01', '2015-12-31') == version
+
+
+def test_only_the_open_tail_of_a_range_expires(tmp_path, monkeypatch):
+    now = [datetime(2015, 7, 15)]
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now[0]
+
+    # Fetched in July 2015, so the bars before July are final and the rest of the year is still open
+    monkeypatch.setattr(price_cache, 'datetime', Clock)
+    path = str(tmp_path / 'prices.sqlite')
+    cache = PriceCache(path, offline=False, provider=StubProvider())
+    cache.prefetch(['AAPL'], '2014-12-01', '2015-12-31')
+    cache.close()
+
+    # Offline, nothing is evicted however old it is
+    now[0] = datetime(2015, 7, 17)
+    cache = PriceCache(path, offline=True, provider=StubProvider())
+    assert len(cache.get_prices('AAPL', '2014-12-01', '2015-12-31')) == 13
+    cache.close()
+
+    cache = PriceCache(path, offline=False, provider=StubProvider())
+    assert cache.missing_ranges('AAPL', '2014-12-01', '2015-12-31') == [('2015-07-01', '2015-12-31')]
+    cache.offline = True
+    assert len(cache.get_prices('AAPL', '2014-12-01', '2015-12-31')) == 7
@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+
+from conftest import START_YEAR
+from rankings_store import SELECTION_METHODS, RankingsStore, get_rankings_store, rank_brands
+
+
+def write_rankings(directory, year, brands, previous_positions):
+    pd.DataFrame({
+        'Brand': brands,
+        'Position': range(1, len(brands) + 1),
+        'Previous Position': previous_positions,
+        'Brand Value ($M)': [100 - i for i in range(len(brands))],
+        'Previous Brand Value ($M)': ['-'] * len(brands),
+        'Rating': ['AAA'] * len(brands),
+        'Previous Rating': ['-'] * len(brands),
+    }).to_csv(os.path.join(directory, f'brandirectory-ranking-data-global-{year}.csv'), index=False)
+
+
+def test_selections(tmp_path):
+    write_rankings(str(tmp_path), 2020, ['A', 'B', 'C', 'D'], [1, 10, '-', 3])
+    store = RankingsStore(str(tmp_path))
+    assert store.years == [2020]
+    assert store.select(2020, 'top', 2) == ['A', 'B']
+    # Position changes: A 0, B 8, C 498 (unranked counts as 501), D -1
+    assert store.select(2020, 'most_improved_exact') == ['C', 'B', 'A', 'D']
+    # Weighted by previous position: B 0.8, C 0.994, A 0, D -0.33
+    assert store.select(2020, 'most_improved_weighted') == ['C', 'B', 'A', 'D']
+
+
+def test_precomputed_selections_match_rank_brands(synthetic_inputs):
+    store = get_rankings_store(synthetic_inputs['rankings_directory'])
+    year_rankings = pd.read_csv(os.path.join(synthetic_inputs['rankings_directory'], f'brandirectory-ranking-data-global-{START_YEAR}.csv'))
+    year_rankings = year_rankings.rename(columns={'Brand': 'brand', 'Position': 'position', 'Previous Position': 'previous_position'})
+    year_rankings['previous_position'] = pd.to_numeric(year_rankings['previous_position'], errors='coerce')
+    for method in SELECTION_METHODS:
+        assert store.select(START_YEAR, method, 50) == rank_brands(year_rankings, method)[:50]
+
+
+def test_cache_is_rebuilt_when_a_file_changes(tmp_path):
+    write_rankings(str(tmp_path), 2020, ['A', 'B'], [1, 2])
+    RankingsStore(str(tmp_path))
+    assert (tmp_path / 'rankings_cache.pkl').exists()
+    assert get_rankings_store(str(tmp_path)).select(2020, 'top') == ['A', 'B']
+
+    write_rankings(str(tmp_path), 2021, ['B', 'A'], [2, 1])
+    store = get_rankings_store(str(tmp_path))
+    assert store.years == [2020, 2021]
+    assert store.select(2021, 'most_improved_exact') == ['B', 'A']
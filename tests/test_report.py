@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from instrumentation import Profiler, set_profiler
+from report import render_report
+
+TABLE = [['', 'Annualized Return', 'Net Sharpe Ratio'], ['Top Brands', 0.1, 1.2], ['S&P 500 Market', 0.08, 0.9]]
+STOCK_DETAILS = {'Top Brands': {2020: [('AAA', 0.2), ('BBB', -0.1)], 2021: [('AAA', 0.05)]}}
+
+
+@pytest.fixture
+def counters():
+    profiler = Profiler()
+    set_profiler(profiler)
+    yield profiler.totals
+    set_profiler(None)
+
+
+def render(directory, yearly_returns):
+    return render_report(TABLE, yearly_returns, STOCK_DETAILS, 2020, 2021, str(directory), ('pdf', 'csv'))
+
+
+def test_unchanged_outputs_are_not_rendered_again(tmp_path, counters):
+    yearly_returns = {'Top Brands': [0.1, 0.2], 'S&P 500 Market': [0.05, 0.1]}
+    paths = render(tmp_path, yearly_returns)
+    # Two charts, the PDF and three CSV files
+    assert counters == {'report_outputs_rendered': 6}
+
+    counters.clear()
+    assert render(tmp_path, yearly_returns) == paths
+    assert counters == {'report_outputs_skipped': 6}
+
+    # New yearly returns change both charts, the PDF that embeds them and the yearly returns CSV, but not the other CSV files
+    counters.clear()
+    render(tmp_path, {'Top Brands': [0.1, 0.3], 'S&P 500 Market': [0.05, 0.1]})
+    assert counters == {'report_outputs_rendered': 4, 'report_outputs_skipped': 2}
+
+    counters.clear()
+    os.remove(tmp_path / 'cumulative_returns.png')
+    os.remove(tmp_path / 'holdings.csv')
+    render(tmp_path, {'Top Brands': [0.1, 0.3], 'S&P 500 Market': [0.05, 0.1]})
+    assert counters == {'report_outputs_rendered': 2, 'report_outputs_skipped': 4}
+    assert os.path.exists(tmp_path / 'cumulative_returns.png') and os.path.exists(tmp_path / 'holdings.csv')
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis_script
+from conftest import END_YEAR, START_YEAR
+from price_cache import PriceCache
+from result_store import ResultStore
+from returns_panel import ReturnsPanel
+
+STRATEGIES = ['top_brands', 'most_improved_weighted']
+
+
+@pytest.fixture
+def computed_years(monkeypatch):
+    # (strategy, year) of every year computed from prices rather than reused from the result store
+    computed = []
+    portfolio_returns = ReturnsPanel.portfolio_returns
+
+    def record(panel, selections, start_year, end_year):
+        computed.extend((name, year) for name, by_year in selections.items() for year in by_year)
+        return portfolio_returns(panel, selections, start_year, end_year)
+
+    monkeypatch.setattr(ReturnsPanel, 'portfolio_returns', record)
+    return computed
+
+
+def evaluate(synthetic_inputs, result_store, end_year=END_YEAR, price_cache=None, mapping_path=None):
+    price_cache = price_cache or PriceCache(synthetic_inputs['price_cache_path'], offline=False, provider=synthetic_inputs['price_provider'])
+    ticker_mapping = analysis_script.load_ticker_mapping(mapping_path or synthetic_inputs['mapping_path'])
+    return analysis_script.evaluate_strategies(STRATEGIES, ticker_mapping, START_YEAR, end_year, synthetic_inputs['rankings_directory'], 10,
+                                               price_cache, result_store)
+
+
+def test_identical_run_computes_no_years(synthetic_inputs, tmp_path, computed_years):
+    result_store = ResultStore(str(tmp_path / 'results.sqlite'))
+    first, _ = evaluate(synthetic_inputs, result_store)
+    assert len(computed_years) == 3 * (END_YEAR - START_YEAR + 1)
+    computed_years.clear()
+    second, _ = evaluate(synthetic_inputs, result_store)
+    assert computed_years == []
+    for name, (monthly_returns, yearly_returns, stock_details) in first.items():
+        assert second[name][1] == pytest.approx(yearly_returns) and second[name][2] == stock_details
+        for year, returns in monthly_returns.items():
+            pd.testing.assert_series_equal(second[name][0][year], returns, check_freq=False)
+
+
+def test_later_end_year_computes_only_new_years(synthetic_inputs, tmp_path, computed_years):
+    result_store = ResultStore(str(tmp_path / 'results.sqlite'))
+    evaluate(synthetic_inputs, result_store, end_year=END_YEAR - 1)
+    computed_years.clear()
+    evaluate(synthetic_inputs, result_store)
+    assert sorted(computed_years) == sorted((name, END_YEAR) for name in STRATEGIES + ['market'])
+
+
+def test_rolled_metrics_match_a_full_recompute(synthetic_inputs, tmp_path):
+    result_store = ResultStore(str(tmp_path / 'results.sqlite'))
+    evaluate(synthetic_inputs, result_store, end_year=END_YEAR - 1)
+    _, configs = evaluate(synthetic_inputs, result_store)
+    full_store = ResultStore(':memory:')
+    evaluate(synthetic_inputs, full_store)
+    for config in configs.values():
+        rolled = result_store.rolled_metrics(config, START_YEAR, END_YEAR)
+        assert rolled == pytest.approx(full_store.rolled_metrics(config, START_YEAR, END_YEAR), nan_ok=True)
+        assert rolled['annualized_return'] != 0
+
+
+def test_offline_run_on_a_cold_cache_stores_nothing(synthetic_inputs, tmp_path, computed_years):
+    result_store = ResultStore(str(tmp_path / 'results.sqlite'))
+    cache_path = str(tmp_path / 'prices.sqlite')
+    offline, _ = evaluate(synthetic_inputs, result_store, price_cache=PriceCache(cache_path, offline=True, provider=synthetic_inputs['price_provider']))
+    assert offline['market'][1] == {}
+
+    price_cache = PriceCache(cache_path, offline=False, provider=synthetic_inputs['price_provider'])
+    online, _ = evaluate(synthetic_inputs, result_store, price_cache=price_cache)
+    assert price_cache.network_requests > 0
+    assert len(online['market'][1]) == END_YEAR - START_YEAR + 1
+
+
+def test_rolled_metrics_follow_unfinished_years(synthetic_inputs, tmp_path):
+    result_store = ResultStore(str(tmp_path / 'results.sqlite'))
+    results, configs = evaluate(synthetic_inputs, result_store)
+
+    # A ticker held in the last year is replaced by one without cached prices, and the next run is offline
+    replaced = results['top_brands'][2][END_YEAR][0][0]
+    mapping = pd.read_csv(synthetic_inputs['mapping_path'])
+    mapping['Ticker'] = mapping['Ticker'].replace(replaced, 'NEW')
+    mapping_path = str(tmp_path / 'mapping.csv')
+    mapping.to_csv(mapping_path, index=False)
+    price_cache = PriceCache(synthetic_inputs['price_cache_path'], offline=True, provider=synthetic_inputs['price_provider'])
+    results, configs = evaluate(synthetic_inputs, result_store, price_cache=price_cache, mapping_path=mapping_path)
+    yearly_returns = results['top_brands'][1]
+    assert replaced not in dict(results['top_brands'][2][END_YEAR])
+
+    # The table is rolled from the same years as the charts and holdings, not from the results stored for the old ticker
+    rolled = result_store.rolled_metrics(configs['top_brands'], START_YEAR, END_YEAR)
+    growth = [1 + yearly_returns[year] for year in range(START_YEAR, END_YEAR + 1)]
+    assert rolled['net_return'] == pytest.approx(np.prod(growth) - 1)
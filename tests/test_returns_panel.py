@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from returns_panel import ReturnsPanel, min_bars_per_year, year_window
+
+
+def daily_prices(tickers, start='2019-12-02', end='2021-12-31'):
+    dates = pd.bdate_range(start, end)
+    return pd.DataFrame({ticker: 100.0 * 1.001 ** np.arange(len(dates)) * (i + 1) for i, ticker in enumerate(tickers)}, index=dates)
+
+
+def test_monthly_window_is_unchanged():
+    assert year_window(2020) == ('2019-12-01', '2020-12-31')
+    assert year_window(2020, '1d') == ('2019-12-01', '2021-01-01')
+    assert min_bars_per_year('1mo') == 12
+
+
+@pytest.mark.parametrize('interval', ['1d', '1wk'])
+def test_daily_and_weekly_years_do_not_overlap(interval):
+    prices = daily_prices(['AAA'])
+    if interval == '1wk':
+        prices = prices.resample('W-FRI').last()
+    panel = ReturnsPanel(prices, interval)
+    returns_2020, _ = panel.year_returns(2020)
+    returns_2021, _ = panel.year_returns(2021)
+    # Each year starts from the last bar of the previous year, so every return belongs to exactly one year
+    assert returns_2020.index.year.unique().tolist() == [2020]
+    assert returns_2021.index.year.unique().tolist() == [2021]
+    all_returns = prices.pct_change(fill_method=None).loc['2020':'2021']
+    pd.testing.assert_frame_equal(pd.concat([returns_2020, returns_2021]), all_returns, check_freq=False)
+
+
+def test_monthly_year_runs_from_the_previous_december():
+    dates = pd.date_range('2019-12-01', '2020-12-01', freq='MS')
+    panel = ReturnsPanel(pd.DataFrame({'AAA': np.arange(100.0, 100.0 + len(dates))}, index=dates))
+    monthly, yearly = panel.year_returns(2020)
+    assert len(monthly) == 12
+    assert yearly['AAA'] == pytest.approx(112.0 / 100.0 - 1)
+
+
+def test_tickers_without_enough_bars_are_left_out():
+    prices = daily_prices(['AAA', 'BBB'])
+    # BBB misses a quarter of 2020, so only AAA is held that year
+    prices.loc['2020-03-01':'2020-06-01', 'BBB'] = np.nan
+    panel = ReturnsPanel(prices, '1d')
+    _, yearly = panel.year_returns(2020)
+    assert yearly.notna().tolist() == [True, False]
+    results = panel.portfolio_returns({'both': {2020: ['AAA', 'BBB'], 2021: ['AAA', 'BBB']}}, 2020, 2021)
+    period_returns, yearly_returns, details = results['both']
+    assert [ticker for ticker, _ in details[2020]] == ['AAA']
+    assert yearly_returns[2020] == pytest.approx(yearly['AAA'])
+    assert len(period_returns[2021]) == len(panel.year_returns(2021)[0])
+
+
+def test_year_returns_are_memoized():
+    panel = ReturnsPanel(daily_prices(['AAA', 'BBB']), '1d')
+    monthly, _ = panel.year_returns(2020)
+    assert panel.year_returns(2020)[0] is monthly
+    assert panel.year_returns(2020, ['BBB'])[0].columns.tolist() == ['BBB']
+
+
+def test_returns_follow_each_tickers_own_calendar():
+    # ^GSPC trades Monday to Friday and 2222.SR Sunday to Thursday, both up 0.1% on each of their own days
+    us_days = pd.bdate_range('2019-12-02', '2020-12-31')
+    saudi_days = pd.bdate_range('2019-12-01', '2020-12-31', freq='C', weekmask='Sun Mon Tue Wed Thu')
+    prices = pd.concat([pd.Series(100.0 * 1.001 ** np.arange(len(days)), index=days, name=ticker)
+                        for ticker, days in [('^GSPC', us_days), ('2222.SR', saudi_days)]], axis=1, sort=True)
+    panel = ReturnsPanel(prices, '1d')
+    daily, yearly = panel.year_returns(2020)
+    for ticker, days in [('^GSPC', us_days), ('2222.SR', saudi_days)]:
+        returns = daily[ticker].dropna()
+        assert returns.index.equals(days[days.year == 2020])
+        assert returns.to_numpy() == pytest.approx(0.001)
+        assert (1 + returns).prod() - 1 == pytest.approx(yearly[ticker])
+
+    results = panel.portfolio_returns({'market': {2020: ['^GSPC']}, 'both': {2020: ['^GSPC', '2222.SR']}}, 2020, 2020)
+    market_returns = results['market'][0][2020]
+    assert market_returns.index.equals(us_days[us_days.year == 2020])
+    # Every date either market trades is a period of the portfolio of both
+    all_days = us_days.union(saudi_days)
+    assert results['both'][0][2020].index.equals(all_days[all_days.year == 2020])
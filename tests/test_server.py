@@ -0,0 +1,70 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import END_YEAR, START_YEAR
+from server import BacktestService, make_server
+
+
+@pytest.fixture(scope='module')
+def base_url(synthetic_inputs):
+    service = BacktestService(offline=False, **synthetic_inputs)
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def get(base_url, path):
+    try:
+        with urllib.request.urlopen(base_url + path, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_health(base_url):
+    status, body = get(base_url, '/health')
+    assert status == 200
+    assert body['years'] == [START_YEAR, END_YEAR]
+
+
+def test_backtest(base_url):
+    status, body = get(base_url, f'/backtest?strategies=top_brands&start_year={START_YEAR}&end_year={END_YEAR}&number_of_brands=10')
+    assert status == 200
+    assert set(body) == {'top_brands', 'market'}
+    assert set(body['top_brands']['yearly_returns']) == {str(year) for year in range(START_YEAR, END_YEAR + 1)}
+    assert body['top_brands']['sharpe_ratio'] is not None
+
+
+def test_number_of_brands_is_capped(base_url):
+    # Every year ranks all 200 synthetic brands, so larger requests select the same portfolio
+    _, capped = get(base_url, '/backtest?strategies=top_brands&number_of_brands=200&market=0')
+    _, requested = get(base_url, '/backtest?strategies=top_brands&number_of_brands=100000&market=0')
+    assert requested == capped
+
+
+@pytest.mark.parametrize('query', ['number_of_brands=0', 'number_of_brands=-5', 'number_of_brands=ten', 'strategies=unknown',
+                                   f'start_year={START_YEAR - 1}', f'start_year={END_YEAR}&end_year={START_YEAR}'])
+def test_invalid_queries(base_url, query):
+    status, body = get(base_url, f'/backtest?{query}')
+    assert status == 400
+    assert body['error']
+
+
+def test_unknown_path(base_url):
+    assert get(base_url, '/missing')[0] == 404
+
+
+def test_unexpected_errors(base_url, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('broken')
+    monkeypatch.setattr(BacktestService, 'backtest', fail)
+    status, body = get(base_url, '/backtest')
+    assert status == 500
+    assert 'broken' in body['error']
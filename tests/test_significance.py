@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from metrics import PERIODS_PER_YEAR
+from significance import block_bootstrap, default_block_length, sample_without_replacement, significance_tests
+
+
+@pytest.mark.parametrize('frequency, block_length', [('1mo', 6), ('1wk', 26), ('1d', 126)])
+def test_blocks_cover_half_a_year(frequency, block_length):
+    assert default_block_length(PERIODS_PER_YEAR[frequency]) == block_length
+
+
+def test_block_bootstrap_keeps_consecutive_returns():
+    returns = np.arange(252, dtype=float)
+    paths = block_bootstrap(returns, 20, default_block_length(252), np.random.default_rng(0))
+    assert paths.shape == (20, 252)
+    # Within a block each return follows the previous one, wrapping around the end of the series
+    steps = np.diff(paths[:, :126], axis=1)
+    assert np.isin(steps, [1, -251]).all()
+
+
+@pytest.mark.parametrize('population, size', [(100, 5), (20, 15)])
+def test_samples_are_distinct_and_in_range(population, size):
+    # 5 of 100 is drawn with Floyd's algorithm, 15 of 20 from random keys
+    picks = sample_without_replacement(np.random.default_rng(0), population, size, 2000)
+    assert picks.shape == (2000, size)
+    assert ((picks >= 0) & (picks < population)).all()
+    assert (np.diff(np.sort(picks, axis=1), axis=1) > 0).all()
+    # Every index is drawn about equally often
+    frequencies = np.bincount(picks.ravel(), minlength=population) / picks.size
+    assert frequencies == pytest.approx(1 / population, rel=0.25)
+
+
+def universes_and_strategies():
+    rng = np.random.default_rng(1)
+    universes = []
+    for _ in range(3):
+        monthly = rng.normal(0.005, 0.05, (12, 40))
+        universes.append((monthly, np.prod(1 + monthly, axis=0) - 1))
+    excess_returns = rng.normal(0.0, 0.02, 36)
+    strategies = {
+        # Far better than any portfolio of the universe, and than the market every month
+        'dominant': ([10, 10, 10], excess_returns + 0.05, {'annualized_return': 2.0, 'sharpe_ratio': 10.0}),
+        'average': ([10, 10, 10], excess_returns, {'annualized_return': 0.0, 'sharpe_ratio': 0.0}),
+    }
+    return universes, strategies
+
+
+def test_significance_does_not_depend_on_processes():
+    universes, strategies = universes_and_strategies()
+    serial = significance_tests(universes, strategies, simulations=1000, processes=1, chunk_size=250)
+    parallel = significance_tests(universes, strategies, simulations=1000, processes=2, chunk_size=250)
+    assert serial == parallel
+
+
+def test_dominant_strategy_is_significant():
+    universes, strategies = universes_and_strategies()
+    results = significance_tests(universes, strategies, simulations=1000, processes=1, chunk_size=250)
+    assert results['dominant']['p_value_annualized_return'] < 0.01
+    assert results['dominant']['p_value_sharpe_ratio'] < 0.01
+    assert results['dominant']['p_value_vs_market'] < 0.01
+    assert results['average']['p_value_annualized_return'] > 0.1
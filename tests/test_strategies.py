@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from conftest import END_YEAR, START_YEAR
+from rankings_store import get_rankings_store
+from strategies import STRATEGIES, rating_score
+
+
+def test_rating_score():
+    assert [rating_score(rating) for rating in ['AAA+', 'AAA', 'AAA-', 'AA+', 'BBB']] == [0, 1, 2, 3, 10]
+    assert rating_score('🔒') is None
+    assert rating_score(None) is None
+
+
+@pytest.mark.parametrize('name', sorted(STRATEGIES))
+def test_registered_strategies(synthetic_inputs, name):
+    # Every synthetic rating parses, so rules see rating categoricals whose scores are all valid
+    store = get_rankings_store(synthetic_inputs['rankings_directory'])
+    # The first year has no previous ratings or values, so rules that compare years select nothing then
+    for year in range(START_YEAR + 1, END_YEAR + 1):
+        brands = STRATEGIES[name].select(synthetic_inputs['rankings_directory'], year, 10)
+        assert 0 < len(brands) <= 10
+        names = brands.index if isinstance(brands, pd.Series) else brands
+        assert set(names) <= set(store.year(year)['brand'])
+
+
+def test_rating_upgrade(tmp_path):
+    pd.DataFrame({
+        'Brand': ['Up', 'Down', 'Same', 'New'],
+        'Position': [1, 2, 3, 4],
+        'Previous Position': [2, 1, 3, '-'],
+        'Brand Value ($M)': [10, 9, 8, 7],
+        'Previous Brand Value ($M)': [9, 10, 8, '-'],
+        'Rating': ['AAA', 'AA', 'A', 'A'],
+        'Previous Rating': ['AA+', 'AAA', 'A', '-'],
+    }).to_csv(tmp_path / 'brandirectory-ranking-data-global-2020.csv', index=False)
+    assert STRATEGIES['rating_upgrade'].select(str(tmp_path), 2020, 10) == ['Up']
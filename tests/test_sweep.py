@@ -0,0 +1,31 @@
+import pytest
+
+import analysis_script
+from conftest import END_YEAR, START_YEAR
+from price_cache import PriceCache
+from result_store import ResultStore
+from sweep import run_sweep
+
+
+@pytest.mark.parametrize('method, strategy', [('top', 'top_brands'), ('most_improved_exact', 'most_improved_exact')])
+def test_sweep_row_matches_main(synthetic_inputs, method, strategy):
+    results = run_sweep(synthetic_inputs['rankings_directory'], brand_counts=[5, 10], methods=[method], processes=2, offline=False,
+                        price_cache_path=synthetic_inputs['price_cache_path'], price_provider=synthetic_inputs['price_provider'],
+                        output_path=None, mapping_path=synthetic_inputs['mapping_path'])
+    # Every configuration is one row
+    assert not results.duplicated(['method', 'number_of_brands', 'start_year', 'end_year']).any()
+    row = results.set_index(['method', 'number_of_brands', 'start_year', 'end_year']).loc[(method, 10, START_YEAR, END_YEAR)]
+
+    price_cache = PriceCache(synthetic_inputs['price_cache_path'], offline=False, provider=synthetic_inputs['price_provider'])
+    result_store = ResultStore(':memory:')
+    ticker_mapping = analysis_script.load_ticker_mapping(synthetic_inputs['mapping_path'])
+    _, configs = analysis_script.evaluate_strategies([strategy], ticker_mapping, START_YEAR, END_YEAR, synthetic_inputs['rankings_directory'],
+                                                     10, price_cache, result_store)
+    expected = result_store.rolled_metrics(configs[strategy], START_YEAR, END_YEAR)
+    market = result_store.rolled_metrics(configs['market'], START_YEAR, END_YEAR)
+    assert row['years'] == END_YEAR - START_YEAR + 1
+    assert row['net_return'] == pytest.approx(expected['net_return'])
+    assert row['annualized_return'] == pytest.approx(expected['annualized_return'])
+    assert row['sharpe_ratio'] == pytest.approx(expected['sharpe_ratio'])
+    assert row['market_annualized_return'] == pytest.approx(market['annualized_return'])
+    assert row['market_sharpe_ratio'] == pytest.approx(market['sharpe_ratio'])
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from ticker_index import TickerIndex, inexact_matches, normalize_brand, unmapped_brands
+
+MAPPING = pd.DataFrame({
+    'Brand': ['Walmart', 'J.P. Morgan', 'Chase', 'Facebook', 'Meta', 3],
+    'Ticker': ['WMT', 'EMB', 'JPM', 'FB', 'META', 'SOXL'],
+    'Aliases': [None, None, 'JPMorgan Chase; JP Morgan', None, None, None],
+    'Valid From': [None, None, None, None, 2022, None],
+    'Valid To': [None, None, None, 2021, None, None],
+})
+
+
+def test_normalize_brand():
+    assert normalize_brand('Wal-Mart') == normalize_brand('Walmart')
+    assert normalize_brand('The Home Depot') == normalize_brand('Home Depot')
+    assert normalize_brand('Amazon.com') == normalize_brand('Amazon')
+    assert normalize_brand('Nestlé') == normalize_brand('NESTLE')
+    assert normalize_brand('Group') == 'group'
+
+
+def test_exact_names_and_aliases_by_default():
+    index = TickerIndex.from_frame(MAPPING)
+    # Normalized matches are not used, but explicit aliases are, ahead of the normalized 'J.P. Morgan'
+    assert index.resolve(['Walmart', 'Wal-Mart', 'JP Morgan', 'JPMorgan Chase', 'J.P. Morgan', '3']) == ['WMT', None, 'JPM', 'JPM', 'EMB', None]
+
+
+def test_normalized_matching_is_opt_in():
+    index = TickerIndex.from_frame(MAPPING, normalized=True)
+    assert index.resolve(['Wal-Mart', 'WALMART', 'JP Morgan']) == ['WMT', 'WMT', 'JPM']
+
+
+def test_valid_years():
+    index = TickerIndex.from_frame(MAPPING.assign(Brand=MAPPING['Brand'].replace('Meta', 'Facebook')))
+    assert index.resolve(['Facebook'], 2021) == ['FB']
+    assert index.resolve(['Facebook'], 2022) == ['META']
+
+
+def test_load_caches_the_compiled_index(tmp_path):
+    mapping_path = str(tmp_path / 'mapping.csv')
+    MAPPING.to_csv(mapping_path, index=False)
+    first = TickerIndex.load(mapping_path)
+    assert (tmp_path / 'ticker_index.pkl').exists()
+    assert TickerIndex.load(mapping_path).entries.equals(first.entries)
+
+
+def test_coverage_reports():
+    rankings = pd.DataFrame({'brand': ['Walmart', 'Wal-Mart', 'Unknown', 'Walmart'], 'year': [2020, 2020, 2020, 2021],
+                             'position': [1, 2, 3, 1]})
+    index = TickerIndex.from_frame(MAPPING)
+    coverage, unmapped = unmapped_brands(index, rankings)
+    assert coverage.to_dict() == {2020: 1 / 3, 2021: 1.0}
+    assert list(unmapped.index) == ['Wal-Mart', 'Unknown']
+    inexact = inexact_matches(index, rankings)
+    assert inexact[['brand', 'mapped_brand', 'ticker']].values.tolist() == [['Wal-Mart', 'Walmart', 'WMT']]
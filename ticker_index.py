@@ -0,0 +1,209 @@
+import os
+import pickle
+import re
+import unicodedata
+
+import pandas as pd
+
+from instrumentation import count, instrumented
+
+DEFAULT_MAPPING_PATH = 'BrandData/CompanyToTicker_with_tickers.xlsx'
+CACHE_FILE_NAME = 'ticker_index.pkl'
+# Bump when normalization or the compiled entries change, so cached indexes are compiled again
+INDEX_VERSION = 2
+# Placeholders the lookup scripts write for brands without a ticker
+MISSING_TICKERS = {'', 'N/A', 'NA', 'NONE', 'NAN'}
+
+# Trailing words that name the legal form rather than the brand, e.g. "Hitachi Group", "Pfizer Inc." or "Amazon.com"
+CORPORATE_SUFFIXES = {
+    'ag', 'asa', 'co', 'com', 'company', 'corp', 'corporation', 'group', 'holding', 'holdings', 'inc', 'incorporated',
+    'limited', 'llc', 'lp', 'ltd', 'nv', 'oyj', 'plc', 'sa', 'sab', 'se', 'spa',
+}
+_NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_brand(name):
+    """
+    Matching key of a brand name: accents removed, casefolded, '&' read as 'and', a leading 'the'
+    and trailing corporate suffixes stripped, and punctuation and spaces dropped, so 'Wal-Mart'
+    and 'Walmart' or 'Amazon.com' and 'Amazon' share a key.
+    """
+    if not isinstance(name, str):
+        return ''
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().casefold().replace('&', ' and ')
+    words = _NON_ALPHANUMERIC.sub(' ', ascii_name).split()
+    if len(words) > 1 and words[0] == 'the':
+        words = words[1:]
+    while len(words) > 1 and words[-1] in CORPORATE_SUFFIXES:
+        words.pop()
+    # Names without any Latin letters or digits are matched on their casefolded form
+    return ''.join(words) or ''.join(name.casefold().split())
+
+
+def _year(value, default):
+    if value is None or pd.isna(value):
+        return default
+    return int(value.year) if hasattr(value, 'year') else int(value)
+
+
+class TickerIndex:
+    """
+    Compiled brand-to-ticker mapping, one row per brand name or alias.
+
+    Every brand matches on its exact name and on the exact names of its aliases (the optional
+    'Aliases' column, separated by ';'). With normalized, names are matched on their normalized
+    keys instead, so 'Wal-Mart' also matches 'Walmart'. The sheet's tickers were looked up for
+    the exact names, so normalized matches can be wrong ('JP Morgan' would get the ticker of
+    'J.P. Morgan') and are off by default; inexact_matches lists them for review.
+
+    Several brands may map to the same ticker, and a brand may have several tickers over time
+    with the optional 'Valid From' and 'Valid To' columns (years or dates, inclusive). Brands
+    without a ticker are left out. When several entries match, a name spelled exactly as ranked
+    wins over a normalized match, and a brand name over an alias.
+    """
+
+    def __init__(self, entries, normalized=False):
+        self.entries = entries.reset_index(drop=True)
+        self.normalized = normalized
+        # Tickers already resolved, keyed by (brand, year), and the rankings table joined in full
+        self._resolved = {}
+        self._joined_table = None
+
+    @classmethod
+    def from_frame(cls, mapping, normalized=False):
+        rows = []
+        for order, row in enumerate(mapping.to_dict('records')):
+            ticker = row.get('Ticker')
+            if not isinstance(ticker, str) or ticker.strip().upper() in MISSING_TICKERS:
+                continue
+            brand = str(row['Brand'])
+            aliases = row.get('Aliases')
+            names = [brand] + ([alias.strip() for alias in aliases.split(';') if alias.strip()] if isinstance(aliases, str) else [])
+            valid_from, valid_to = _year(row.get('Valid From'), -1), _year(row.get('Valid To'), 9999)
+            # Exact names are the sheet's cells as read: a numeric cell such as the brand 3 is not the ranked name '3'
+            exact_names = [row['Brand']] + names[1:]
+            for priority, (exact_name, name) in enumerate(zip(exact_names, names)):
+                rows.append((exact_name, normalize_brand(name), brand, ticker.strip(), valid_from, valid_to, min(priority, 1), order))
+        entries = pd.DataFrame(rows, columns=['name', 'key', 'brand', 'ticker', 'valid_from', 'valid_to', 'alias', 'order'])
+        return cls(entries[entries['key'] != ''], normalized)
+
+    @classmethod
+    def from_mapping(cls, mapping, normalized=False):
+        # A plain {brand: ticker} dict, as loaded by earlier versions of load_ticker_mapping
+        return cls.from_frame(pd.DataFrame({'Brand': list(mapping), 'Ticker': list(mapping.values())}), normalized)
+
+    @classmethod
+    @instrumented('load_ticker_index')
+    def load(cls, mapping_path=DEFAULT_MAPPING_PATH, cache_path=None, normalized=False):
+        """
+        Load the index compiled from a mapping spreadsheet (or CSV), from a binary cache next to
+        it that is compiled again whenever the spreadsheet changes.
+        """
+        cache_path = cache_path or os.path.join(os.path.dirname(mapping_path), CACHE_FILE_NAME)
+        stat = os.stat(mapping_path)
+        signature = (INDEX_VERSION, os.path.abspath(mapping_path), stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('signature') == signature:
+                count('ticker_index_cache_hits')
+                return cls(cached['entries'], normalized)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f'Ignoring unreadable ticker index {cache_path}: {e}')
+        count('ticker_index_cache_misses')
+
+        mapping = pd.read_csv(mapping_path) if mapping_path.endswith('.csv') else pd.read_excel(mapping_path)
+        index = cls.from_frame(mapping, normalized)
+        with open(cache_path, 'wb') as f:
+            pickle.dump({'signature': signature, 'entries': index.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+    def join(self, table, mapped_brand=False):
+        """
+        Return a copy of table (with a 'brand' and optionally a 'year' column) with the matching
+        ticker of every row in a 'ticker' column, NaN where no entry matches. With mapped_brand,
+        the mapping's brand name that matched is added in a 'mapped_brand' column.
+        """
+        brands = table['brand'].tolist()
+        if self.normalized:
+            # Brands repeat across years, so each distinct name is normalized once
+            keys = {brand: normalize_brand(brand) for brand in set(brands)}
+            on, values = 'key', [keys[brand] for brand in brands]
+        else:
+            on, values = 'name', brands
+        rows = pd.DataFrame({'row': range(len(table)), 'brand': brands, on: values,
+                             'year': table['year'].to_numpy() if 'year' in table else None})
+        matches = rows.merge(self.entries if on == 'key' else self.entries.drop(columns='key'), on=on, suffixes=('', '_entry'))
+        if 'year' in table:
+            year = pd.to_numeric(matches['year'], errors='coerce')
+            matches = matches[year.isna() | ((matches['valid_from'] <= year) & (year <= matches['valid_to']))]
+        # A brand or alias spelled exactly as ranked wins over names that only share its normalized key
+        matches = matches.assign(inexact=matches['brand'] != matches['name'])
+        best = matches.sort_values(['row', 'inexact', 'alias', 'order']).drop_duplicates('row')
+        tickers = pd.Series(best['ticker'].to_numpy(), index=best['row'].to_numpy()).reindex(range(len(table)))
+        if mapped_brand:
+            brands = pd.Series(best['brand_entry'].to_numpy(), index=best['row'].to_numpy()).reindex(range(len(table)))
+            return table.assign(ticker=tickers.to_numpy(), mapped_brand=brands.to_numpy())
+        return table.assign(ticker=tickers.to_numpy())
+
+    def join_rankings(self, rankings_table):
+        """
+        Resolve every brand and year of a rankings table in one join, so later lookups of its
+        brands are dictionary hits. Joining the same table again is a no-op.
+        """
+        if rankings_table is self._joined_table:
+            return
+        joined = self.join(rankings_table[['brand', 'year']])
+        tickers = [ticker if isinstance(ticker, str) else None for ticker in joined['ticker'].tolist()]
+        self._resolved.update(zip(zip(joined['brand'].tolist(), joined['year'].astype(int).tolist()), tickers))
+        self._joined_table = rankings_table
+
+    def resolve(self, brands, year=None):
+        # The ticker of every brand in order, None where a brand has no ticker
+        brands = list(brands)
+        year = None if year is None else int(year)
+        missing = list(dict.fromkeys(brand for brand in brands if (brand, year) not in self._resolved))
+        if missing:
+            joined = self.join(pd.DataFrame({'brand': missing, 'year': year}))
+            self._resolved.update(((brand, year), ticker if isinstance(ticker, str) else None) for brand, ticker in zip(missing, joined['ticker']))
+        return [self._resolved[(brand, year)] for brand in brands]
+
+    def tickers(self, brands, year=None):
+        # The tickers of the brands that have one, in brand order
+        return [ticker for ticker in self.resolve(brands, year) if ticker is not None]
+
+
+@instrumented()
+def unmapped_brands(index, rankings_table):
+    """
+    Coverage of a rankings table (brand, year and position columns) by the index.
+
+    Returns (coverage, unmapped): the share of ranked brands with a ticker in each year, and one
+    row per brand without a ticker in some year, with its first and last such year and best position.
+    """
+    joined = index.join(rankings_table[['brand', 'year', 'position']])
+    mapped = joined['ticker'].notna()
+    coverage = mapped.groupby(joined['year']).mean().rename('coverage')
+    unmapped = joined[~mapped].groupby('brand').agg(first_year=('year', 'min'), last_year=('year', 'max'), years=('year', 'nunique'),
+                                                   best_position=('position', 'min'))
+    return coverage, unmapped.sort_values(['best_position', 'years'], ascending=[True, False])
+
+
+@instrumented()
+def inexact_matches(index, rankings_table):
+    """
+    Ranked brands that would get a ticker through a normalized name but not through their exact
+    name or an explicit alias, whether or not index uses normalized matching. The mapping's
+    tickers were looked up for the exact names, so these are candidates to review and add as
+    aliases: one row per brand and mapped brand, with the ticker, first and last year, number
+    of years and best position.
+    """
+    table = rankings_table[['brand', 'year', 'position']]
+    exact = TickerIndex(index.entries).join(table)['ticker']
+    joined = TickerIndex(index.entries, normalized=True).join(table, mapped_brand=True)
+    inexact = joined[joined['ticker'].notna() & (joined['ticker'] != exact)]
+    matches = inexact.groupby(['brand', 'mapped_brand', 'ticker']).agg(first_year=('year', 'min'), last_year=('year', 'max'),
+                                                                     years=('year', 'nunique'), best_position=('position', 'min'))
+    return matches.reset_index().sort_values(['best_position', 'years'], ascending=[True, False])